@@ -0,0 +1,178 @@
+"""
+Benchmarks de los caminos críticos: inferencia, cruza y mutación, generaciones del GA y simulación sin ventana.
+
+Se ejecuta desde la raíz del repositorio y escribe un objeto JSON por línea y por medición:
+
+    python -m benchmarks.run
+    python -m benchmarks.run --only feed_forward --repeat 7 --output resultados.jsonl
+
+Cada medición usa semillas fijas, así dos corridas del mismo commit miden exactamente el mismo trabajo. Los tiempos
+son segundos por operación: el mínimo, la mediana y el promedio de 'repeat' repeticiones de 'number' operaciones.
+"""
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import timeit
+
+import numpy as np
+
+from game.batch import BatchFlappyEngine
+from game.engine import FlappyEngine, JUMP_THRESHOLD
+from ia.EvolutionaryNetwork import NetworkOrganism, GenomeNetworkOrganism, GeneticAlg, selection_function
+from ia.NeuralNetwork import NeuralNetwork
+from ia.Neuron import Sigmoid
+from ia.PopulationNetwork import PopulationNetwork
+
+LAYERS_CONF = [3, 8, 8, 8, 1]
+SEED = 0
+
+BENCHMARKS = {}
+
+
+def benchmark(function):
+    """ Registra una función que recibe repeat y genera registros con measure """
+    BENCHMARKS[function.__name__] = function
+    return function
+
+
+def seed_everything(seed=SEED):
+    random.seed(seed)
+    np.random.seed(seed)
+
+
+def measure(name, operation, number, repeat, params=None, items=1):
+    """
+    Mide operation y retorna un registro.
+
+    :param number: Llamadas a operation por repetición
+    :param items: Unidades de trabajo por llamada (cuadros, redes, organismos), para calcular items_per_second
+    """
+    times = [total / number for total in timeit.Timer(operation).repeat(repeat=repeat, number=number)]
+    return {'benchmark': name,
+            'params': params or {},
+            'number': number,
+            'repeat': repeat,
+            'min': min(times),
+            'median': float(np.median(times)),
+            'mean': float(np.mean(times)),
+            'items_per_second': items / min(times)}
+
+
+def random_network():
+    return NeuralNetwork(LAYERS_CONF, neuron_type=Sigmoid)
+
+
+def random_inputs(n):
+    return np.random.random_sample((n, LAYERS_CONF[0])) * FlappyEngine.HEIGHT
+
+
+@benchmark
+def feed_forward(repeat):
+    seed_everything()
+    network = random_network()
+    inputs = random_inputs(256)
+    yield measure('feed_forward', lambda: network.feed_forward(inputs[0]), 2000, repeat)
+    yield measure('feed_forward_neurons', lambda: network.feed_forward_neurons(inputs[0]), 200, repeat)
+    for batch in (16, 256):
+        yield measure('feed_forward_batch', lambda: network.feed_forward(inputs[:batch]), 1000, repeat,
+                      {'batch': batch}, items=batch)
+    for population in (20, 200):
+        population_network = PopulationNetwork.from_networks([random_network() for _ in range(population)])
+        observations = random_inputs(population)
+        yield measure('population_feed_forward', lambda: population_network.feed_forward(observations), 500,
+                      repeat, {'population': population}, items=population)
+
+
+@benchmark
+def neuron_guess(repeat):
+    seed_everything()
+    neuron = Sigmoid(ninputs=8)
+    inputs = np.random.random_sample(8)
+    yield measure('neuron_guess', lambda: neuron.guess(inputs), 5000, repeat)
+
+
+@benchmark
+def breeding(repeat):
+    seed_everything()
+    for organism_type in (NetworkOrganism, GenomeNetworkOrganism):
+        parent1, parent2 = organism_type(), organism_type()
+        params = {'organism': organism_type.__name__}
+        yield measure('breed', lambda: parent1.breed(parent2), 200, repeat, params)
+        yield measure('mutate', lambda: parent1.mutate(), 200, repeat, params)
+
+
+@benchmark
+def generation(repeat):
+    """ breed_new_generation con un fitness aleatorio, para medir selección, cruza y mutación sin jugar """
+    for organism_type in (NetworkOrganism, GenomeNetworkOrganism):
+        for population in (20, 100, 500):
+            genetic_alg = GeneticAlg(pop_size=population, organism_type=organism_type,
+                                     fitness_function=lambda organism: random.random(),
+                                     selection_function=selection_function, seed=SEED)
+            yield measure('breed_new_generation', genetic_alg.breed_new_generation, 3, repeat,
+                          {'organism': organism_type.__name__, 'population': population}, items=population)
+
+
+def play_ticks(engine, network, ticks):
+    """ Simula 'ticks' cuadros controlados por network, reiniciando el episodio cada vez que el ave choca """
+    engine.reset(SEED)
+    for _ in range(ticks):
+        if not engine.step(network.feed_forward(engine.get_distances())[0] > JUMP_THRESHOLD):
+            engine.reset()
+
+
+@benchmark
+def simulation(repeat):
+    seed_everything()
+    ticks = 2000
+    engine = FlappyEngine(SEED)
+    network = random_network().compiled
+    yield measure('engine_ticks', lambda: play_ticks(engine, network, ticks), 1, repeat,
+                  {'ticks': ticks}, items=ticks)
+
+    for n_birds in (20, 200):
+        batch = BatchFlappyEngine(n_birds, seed=SEED)
+        population_network = PopulationNetwork.from_networks([random_network() for _ in range(n_birds)])
+
+        def play_batch_ticks():
+            # Las aves no se detienen al chocar para que todas las mediciones simulen la misma cantidad de aves
+            batch.reset(SEED)
+            for _ in range(ticks):
+                batch.update(population_network.feed_forward(batch.get_distances())[:, 0] > JUMP_THRESHOLD)
+                batch.check_collision()
+
+        yield measure('batch_engine_bird_ticks', play_batch_ticks, 1, repeat,
+                      {'ticks': ticks, 'birds': n_birds}, items=ticks * n_birds)
+
+
+def environment():
+    return {'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def run(names, repeat, output):
+    env = environment()
+    for name in names:
+        for record in BENCHMARKS[name](repeat):
+            record.update(env)
+            output.write(json.dumps(record) + '\n')
+            output.flush()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks de FlappyIA')
+    parser.add_argument('--only', nargs='*', choices=sorted(BENCHMARKS), default=None,
+                        help='Grupos de benchmarks a correr. Por defecto todos')
+    parser.add_argument('--repeat', type=int, default=5, help='Repeticiones de cada medición')
+    parser.add_argument('--output', default=None, help='Archivo JSON lines. Por defecto la salida estándar')
+    args = parser.parse_args()
+
+    selected = args.only or list(BENCHMARKS)
+    if args.output is None:
+        run(selected, args.repeat, sys.stdout)
+    else:
+        with open(args.output, 'a') as f:
+            run(selected, args.repeat, f)
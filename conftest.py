@@ -0,0 +1,7 @@
+"""
+Configuración de pytest. Al estar en la raíz del repositorio, pytest la agrega a sys.path y los tests importan game e ia
+igual que main.py. Los tests que abren una ventana de pygame usan el driver de video sin pantalla.
+"""
+import os
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
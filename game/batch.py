@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+Simulación vectorizada de muchas aves a la vez.
+
+Sigue las mismas reglas que game.engine.FlappyEngine, pero el estado de las N aves se guarda en arreglos de NumPy y
+cada llamada a step avanza a todas en un solo paso. Como todas las aves tienen la misma posición horizontal y los
+tubos se mueven a la misma velocidad, la posición horizontal de los tubos es compartida y solo la altura del espacio
+entre tubos puede variar entre aves.
+"""
+import random
+
+import numpy as np
+
+from game.engine import FlappyEngine, BirdState, TubesPairState, EpisodeResult, FRAME_TIME, JUMP_THRESHOLD, \
+    TUBES_SPEED, COLLISION_BOX, COLLISION_SHAPE, NO_LIMITS, fall_delta, gap_offsets, jump_delta, time_is_up, \
+    tubes_fitness, tubes_left_limit
+from game.hitbox import load_hitboxes, pixel, pixels
+
+
+class BatchFlappyEngine:
+    WIDTH = FlappyEngine.WIDTH
+    HEIGHT = FlappyEngine.HEIGHT
+    TUBES_DISTANCE = FlappyEngine.TUBES_DISTANCE
+    TUBES_PAIRS = FlappyEngine.TUBES_PAIRS
+
+    SHARED = 'shared'
+    PER_BIRD = 'per_bird'
+
+    def __init__(self, n_birds, layout=SHARED, seed=None, collision=COLLISION_SHAPE):
+        """
+        :param n_birds: Cantidad de aves simuladas
+        :param layout: SHARED para que todas las aves vean los mismos tubos. PER_BIRD para que cada ave tenga su
+                       propia secuencia de alturas de tubos
+        :param seed: Semilla de las alturas de tubos. Con SHARED los tubos son los mismos que los de
+                     FlappyEngine(seed). Con PER_BIRD puede ser una lista con una semilla por ave, y el ave i ve los
+                     tubos de FlappyEngine(seed[i])
+        :param collision: Modelo de choque, ver FlappyEngine
+        """
+        assert layout in (self.SHARED, self.PER_BIRD)
+        assert collision in (COLLISION_BOX, COLLISION_SHAPE)
+        self.collision = collision
+        self.hitboxes = load_hitboxes() if collision == COLLISION_SHAPE else None
+        self.n_birds = n_birds
+        self.layout = layout
+        self.rngs = []
+        self.seed_rngs(seed)
+
+        self.bird_x = int(self.WIDTH / 3)
+        self.left_limit = tubes_left_limit(self.WIDTH, self.TUBES_DISTANCE)
+
+        self.bird_y = np.zeros(n_birds)
+        self.alive = np.ones(n_birds, dtype=bool)
+        self.truncated = np.zeros(n_birds, dtype=bool)
+        self.score = np.zeros(n_birds, dtype=int)
+        self.fitness = np.zeros(n_birds)
+        self.ticks_alive = np.zeros(n_birds, dtype=int)
+        self.tubes_left = np.zeros(self.TUBES_PAIRS)
+        self.tubes_center = np.zeros((n_birds, self.TUBES_PAIRS))
+        self.next_tubes = 0
+        self.ticks = 0
+        self.reset()
+
+    def seed_rngs(self, seed):
+        if self.layout == self.SHARED:
+            self.rngs = [random.Random(seed)]
+            return
+        if seed is None or isinstance(seed, int):
+            master = random.Random(seed)
+            seed = [master.getrandbits(32) for _ in range(self.n_birds)]
+        assert len(seed) == self.n_birds
+        self.rngs = [random.Random(bird_seed) for bird_seed in seed]
+
+    def random_centers(self):
+        """ Alturas para un par de tubos, una por ave """
+        low, high = int(self.HEIGHT * (2 / 5)), int(self.HEIGHT * (3 / 5))
+        if self.layout == self.SHARED:
+            return np.full(self.n_birds, self.rngs[0].uniform(low, high))
+        return np.array([rng.uniform(low, high) for rng in self.rngs])
+
+    def reset(self, seed=None):
+        """
+        :param seed: Si no es None se reinician los generadores de tubos con esta semilla (ver __init__)
+        """
+        if seed is not None:
+            self.seed_rngs(seed)
+        self.bird_y[:] = int(self.HEIGHT * (1 / 3))
+        self.alive[:] = True
+        self.truncated[:] = False
+        self.score[:] = 0
+        self.fitness[:] = 0
+        self.ticks_alive[:] = 0
+        self.next_tubes = 0
+        self.ticks = 0
+        for i in range(self.TUBES_PAIRS):
+            self.tubes_left[i] = int(self.WIDTH + self.TUBES_DISTANCE * i)
+            self.tubes_center[:, i] = self.random_centers()
+
+    def update(self, jump, time=FRAME_TIME):
+        """ Avanza un cuadro a las aves vivas sin revisar choques """
+        jump = np.asarray(jump, dtype=bool)
+        fall, rise = fall_delta(time), jump_delta(time)
+
+        top = self.bird_y - BirdState.HEIGHT / 2
+        bottom = self.bird_y + BirdState.HEIGHT / 2
+        inside = (top >= 0) & (bottom <= self.HEIGHT)
+        movement = np.where(inside, np.where(jump, rise, fall), np.where(top <= 0, fall, 0))
+        self.bird_y += np.where(self.alive, movement, 0)
+
+        self.tubes_left -= TUBES_SPEED * time
+        for i in np.flatnonzero(self.tubes_left < self.left_limit):
+            self.tubes_left[i] = self.WIDTH
+            self.tubes_center[:, i] = self.random_centers()
+
+        # Todas las aves tienen la misma posición horizontal, así que pasan los tubos al mismo tiempo
+        if self.tubes_left[self.next_tubes] + TubesPairState.WIDTH < self.bird_x - BirdState.WIDTH / 2:
+            self.score += self.alive
+            self.next_tubes = int((self.next_tubes + 1) % self.TUBES_PAIRS)
+
+        self.ticks += 1
+        self.ticks_alive += self.alive
+
+    def step(self, jump, time=FRAME_TIME):
+        """
+        Avanza un cuadro y marca como muertas las aves que chocan. El fitness de cada ave queda fijo en el cuadro en
+        que choca.
+
+        :param jump: Arreglo de booleanos de tamaño n_birds
+        :return: Arreglo con las aves que siguen vivas
+        """
+        self.update(jump, time)
+        crashed = self.alive & self.check_collision()
+        if crashed.any():
+            self.fitness[crashed] = self.get_fitness()[crashed]
+            self.alive &= ~crashed
+        return self.alive
+
+    def check_limits(self, limits, deadline=None):
+        """
+        Corta el episodio de las aves vivas que alcanzaron algún límite. Su fitness queda fijo como al chocar, pero
+        se marcan en truncated en lugar de contarse como choques.
+
+        :param limits: EpisodeLimits (game.engine)
+        :param deadline: Hora límite (ver EpisodeLimits.deadline)
+        :return: Arreglo con las aves truncadas en este cuadro
+        """
+        if limits.ticks_reached(self.ticks) or time_is_up(deadline):
+            truncated = self.alive.copy()
+        else:
+            truncated = self.alive & limits.score_reached(self.score)
+        if truncated.any():
+            self.fitness[truncated] = self.get_fitness()[truncated]
+            self.truncated |= truncated
+            self.alive &= ~truncated
+        return truncated
+
+    def result(self):
+        """ EpisodeResult con un arreglo por campo. Solo es definitivo cuando ya no quedan aves vivas """
+        return EpisodeResult(self.fitness.copy(), self.score.copy(), self.ticks_alive.copy(), self.truncated.copy())
+
+    def check_collision(self):
+        """ Choque de cada ave con los tubos del frente o con el suelo, con posiciones en pixeles como FlappyEngine """
+        left = pixel(self.tubes_left[self.next_tubes])
+        right = left + TubesPairState.WIDTH
+        center = self.tubes_center[:, self.next_tubes]
+        up_top = pixels(center + TubesPairState.HALF_GAP)
+        down_bottom = pixels(center - TubesPairState.HALF_GAP)
+
+        bird_left = self.bird_x - BirdState.WIDTH // 2
+        bird_top = pixels(self.bird_y) - BirdState.HEIGHT // 2
+        bird_bottom = bird_top + BirdState.HEIGHT
+        overlap_x = bird_left < right and left < bird_left + BirdState.WIDTH
+
+        hit_up = overlap_x & (bird_top < up_top + TubesPairState.HEIGHT) & (up_top < bird_bottom)
+        hit_down = overlap_x & (bird_top < down_bottom) & (down_bottom - TubesPairState.HEIGHT < bird_bottom)
+
+        if self.collision == COLLISION_SHAPE:
+            # Solo las aves cuyos rectángulos tocan un tubo revisan la forma de los sprites
+            bird = self.hitboxes['bird']
+            for hit, tube, tube_top in ((hit_up, self.hitboxes['tube_up'], up_top),
+                                        (hit_down, self.hitboxes['tube_down'], down_bottom - TubesPairState.HEIGHT)):
+                candidates = np.flatnonzero(hit)
+                if len(candidates):
+                    hit[candidates] = tube.overlaps_many(left, tube_top[candidates], bird, bird_left,
+                                                         bird_top[candidates])
+
+        return hit_up | hit_down | (bird_bottom > self.HEIGHT)
+
+    def get_distances(self):
+        """ Arreglo (n_birds, 3) con las mismas distancias que FlappyEngine.get_distances """
+        right = self.tubes_left[self.next_tubes] + TubesPairState.WIDTH
+        dx, dy_up, dy_down = gap_offsets(self.bird_x, self.bird_y, right, self.tubes_center[:, self.next_tubes])
+        observations = np.empty((self.n_birds, 3))
+        observations[:, 0] = self.HEIGHT - self.bird_y
+        observations[:, 1] = np.hypot(dx, dy_up)
+        observations[:, 2] = np.hypot(dx, dy_down)
+        return observations
+
+    def get_fitness(self):
+        distances = self.get_distances()
+        return tubes_fitness(self.score, distances[:, 1], distances[:, 2], self.HEIGHT)
+
+
+def players_policy(players):
+    """
+    Política para play_batch a partir de una lista de jugadores con feed_forward, evaluados uno por uno.
+    """
+    def policy(observations, alive):
+        jump = np.zeros(len(players), dtype=bool)
+        for i in np.flatnonzero(alive):
+            jump[i] = players[i].feed_forward(observations[i])[0] > JUMP_THRESHOLD
+        return jump
+    return policy
+
+
+def network_policy(population_network):
+    """
+    Política para play_batch a partir de un PopulationNetwork (ia.PopulationNetwork). Toda la población decide en una
+    sola llamada; el ave i es controlada por la red i.
+    """
+    def policy(observations, alive):
+        return population_network.feed_forward(observations)[:, 0] > JUMP_THRESHOLD
+    return policy
+
+
+def play_networks(population_network, seed=None, limits=NO_LIMITS, deadline=None, recorder=None):
+    """ Hace jugar un episodio a cada red de un PopulationNetwork. Útil como play_function de ia.evaluation """
+    n_birds = len(population_network)
+    return play_batch(network_policy(population_network), n_birds, seed=seed, limits=limits, deadline=deadline,
+                      recorder=recorder)
+
+
+def play_batch(policy, n_birds, seed=None, engine=None, limits=NO_LIMITS, deadline=None, on_tick=None,
+               recorder=None):
+    """
+    Hace jugar un episodio a todas las aves hasta que todas chocan o alcanzan algún límite.
+
+    :param policy: Función policy(observaciones, vivas) que retorna un arreglo de booleanos indicando que aves saltan
+    :param n_birds: Cantidad de aves
+    :param seed: Semilla de los tubos del episodio
+    :param engine: BatchFlappyEngine a usar. Si es None se crea uno con tubos compartidos
+    :param limits: EpisodeLimits (game.engine) para cortar el episodio de las aves que no chocan
+    :param deadline: Hora (time.time()) en que se corta el episodio, además de limits.max_seconds
+    :param on_tick: Función on_tick(engine) que se llama después de cada cuadro, p. ej. para dibujarlo
+    :param recorder: Objeto con record_batch(engine, saltos) que se llama antes de cada cuadro, como
+                     game.trace.TraceWriter
+    :return: EpisodeResult con un arreglo por campo
+    """
+    if engine is None:
+        engine = BatchFlappyEngine(n_birds, seed=seed)
+    else:
+        assert engine.n_birds == n_birds
+        engine.reset(seed)
+    deadline = limits.deadline(deadline)
+
+    engine.check_limits(limits, deadline)
+    while engine.alive.any():
+        jump = policy(engine.get_distances(), engine.alive)
+        if recorder is not None:
+            recorder.record_batch(engine, jump)
+        engine.step(jump)
+        engine.check_limits(limits, deadline)
+        if on_tick is not None:
+            on_tick(engine)
+    return engine.result()
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Canal de comunicación entre el proceso del juego y el proceso del agente sobre memoria compartida.
+
+El juego escribe un registro de tamaño fijo por cuadro en un buffer circular y el agente responde escribiendo una
+acción. Cada registro y cada acción llevan un número de secuencia, de modo que el lector sabe si perdió cuadros o si
+está leyendo un dato viejo, sin serializar nada con pickle.
+"""
+import time as pytime
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class Actions:
+    """ Acciones que el agente puede enviar. Son flags que se pueden combinar """
+    NONE = 0
+    JUMP = 1
+    ENTER = 2
+
+
+class ChannelOverrun(Exception):
+    """ El lector se atrasó más que el tamaño del buffer y se perdieron cuadros """
+
+
+class ChannelTimeout(Exception):
+    """ No llegó un registro nuevo en el tiempo pedido """
+
+
+class SharedChannel:
+    # Cabecera: cuadros escritos y última acción. La acción y su secuencia se guardan juntas en un solo float
+    # (secuencia * ACTION_BASE + acción) para que el juego nunca lea una acción con la secuencia de otra
+    HEADER_SIZE = 2
+    WRITE_SEQ = 0
+    ACTION = 1
+    ACTION_BASE = 4
+
+    # Registro de un cuadro: secuencia, estado del juego, 3 distancias y puntaje
+    RECORD_SIZE = 6
+    SEQ = 0
+    STATE = 1
+    DISTANCES = slice(2, 5)
+    SCORE = 5
+
+    def __init__(self, capacity=64, name=None):
+        """
+        :param capacity: Cantidad de registros del buffer circular
+        :param name: Nombre de un bloque de memoria compartida existente. Si es None se crea uno nuevo
+        """
+        self.capacity = capacity
+        size = (self.HEADER_SIZE + capacity * self.RECORD_SIZE) * np.dtype(np.float64).itemsize
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=size)
+        self._attach()
+        if self.owner:
+            self.header[:] = 0
+            self.records[:] = 0
+            self.records[:, self.SEQ] = -1
+
+    def _attach(self):
+        buffer = np.ndarray((self.HEADER_SIZE + self.capacity * self.RECORD_SIZE,), dtype=np.float64,
+                            buffer=self.shm.buf)
+        self.header = buffer[:self.HEADER_SIZE]
+        self.records = buffer[self.HEADER_SIZE:].reshape(self.capacity, self.RECORD_SIZE)
+        # Estado local de cada extremo
+        self.next_read = 0
+        self.last_action_seq = 0
+
+    def __getstate__(self):
+        return {'capacity': self.capacity, 'name': self.shm.name}
+
+    def __setstate__(self, state):
+        self.capacity = state['capacity']
+        self.owner = False
+        self.shm = shared_memory.SharedMemory(name=state['name'])
+        self._attach()
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    # Lado del juego
+
+    def write(self, state, distances=None, score=0):
+        """ Publica un cuadro y retorna su número de secuencia """
+        seq = int(self.header[self.WRITE_SEQ])
+        record = self.records[seq % self.capacity]
+        record[self.SEQ] = -1  # Marca el registro como incompleto mientras se escribe
+        record[self.STATE] = state
+        record[self.DISTANCES] = distances if distances is not None else np.nan
+        record[self.SCORE] = score
+        record[self.SEQ] = seq
+        self.header[self.WRITE_SEQ] = seq + 1
+        return seq
+
+    def read_action(self):
+        """
+        :return: (secuencia, acción) si el agente envió una acción nueva desde la última lectura, si no None
+        """
+        seq, action = divmod(int(self.header[self.ACTION]), self.ACTION_BASE)
+        if seq == self.last_action_seq:
+            return None
+        self.last_action_seq = seq
+        # Número del cuadro al que responde la acción
+        return seq - 1, action
+
+    def wait_action(self, frame_seq, timeout=None):
+        """
+        Espera la respuesta del agente al cuadro frame_seq. Las respuestas a cuadros anteriores se descartan.
+
+        :param timeout: Segundos a esperar. None espera indefinidamente
+        :return: La acción, o None si se cumplió el timeout
+        """
+        start = pytime.perf_counter()
+        while True:
+            action = self.read_action()
+            if action is not None and action[0] >= frame_seq:
+                return action[1]
+            if timeout is not None and pytime.perf_counter() - start > timeout:
+                return None
+            pytime.sleep(0)
+
+    # Lado del agente
+
+    def read(self, timeout=None):
+        """
+        Lee el siguiente cuadro en orden.
+
+        :param timeout: Segundos a esperar por un cuadro nuevo. None espera indefinidamente
+        :return: (secuencia, estado, distancias, puntaje)
+        """
+        start = pytime.perf_counter()
+        seq = self.next_read
+        while self.header[self.WRITE_SEQ] <= seq:
+            if timeout is not None and pytime.perf_counter() - start > timeout:
+                raise ChannelTimeout('No se recibió el cuadro {}'.format(seq))
+            pytime.sleep(0)
+
+        written = int(self.header[self.WRITE_SEQ])
+        if written - seq > self.capacity:
+            raise ChannelOverrun('Se perdieron {} cuadros'.format(written - seq - self.capacity))
+
+        record = self.records[seq % self.capacity].copy()
+        # Si el juego sobrescribió el registro mientras se copiaba la secuencia ya no coincide
+        if record[self.SEQ] != seq or self.records[seq % self.capacity, self.SEQ] != seq:
+            raise ChannelOverrun('El cuadro {} fue sobrescrito mientras se leía'.format(seq))
+
+        self.next_read = seq + 1
+        return seq, int(record[self.STATE]), tuple(record[self.DISTANCES].tolist()), float(record[self.SCORE])
+
+    def send_action(self, frame_seq, action):
+        """ Responde al cuadro frame_seq con una acción de Actions """
+        self.header[self.ACTION] = (frame_seq + 1) * self.ACTION_BASE + action
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
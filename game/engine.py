@@ -0,0 +1,390 @@
+# -*- coding: utf-8 -*-
+"""
+Motor de simulación de Flappy sin dependencias de pygame.
+
+Contiene las mismas reglas que los sprites de game.flappy (caída, salto, movimiento de tubos, puntaje y choques), pero
+sin ventana, sin carga de imágenes y sin límite de cuadros por segundo. FlappyGame lo usa como modelo y solo se
+encarga de dibujarlo.
+"""
+import math
+import random
+import time as pytime
+from collections import namedtuple
+
+from game.hitbox import load_hitboxes, pixel
+
+# Tiempo de un cuadro en milisegundos cuando el juego corre a 60 FPS
+FRAME_TIME = 1000 / 60
+
+# Velocidades del ave y de los tubos, compartidas por FlappyEngine y game.batch.BatchFlappyEngine
+BIRD_SPEED = 0.1
+BIRD_ACCEL = 0.1
+TUBES_SPEED = 0.2
+
+# Umbral de la salida de la red para decidir si el ave salta
+JUMP_THRESHOLD = 0.5
+
+# Modelos de choque: rectángulos de los sprites completos o formas por fila de pixeles (ver game.hitbox)
+COLLISION_BOX = 'box'
+COLLISION_SHAPE = 'shape'
+
+
+# Resultado de un episodio. truncated indica que el episodio se cortó por un límite (EpisodeLimits) y no porque el ave
+# chocó. En play_batch cada campo es un arreglo con un valor por ave
+EpisodeResult = namedtuple('EpisodeResult', ['fitness', 'score', 'ticks', 'truncated'])
+
+
+class EpisodeLimits:
+    """ Límites para cortar episodios de aves que ya no chocan. None significa sin límite """
+
+    def __init__(self, max_ticks=None, max_score=None, max_seconds=None):
+        """
+        :param max_ticks: Cuadros máximos del episodio
+        :param max_score: Puntaje con el que se da por terminado el episodio
+        :param max_seconds: Segundos de reloj que puede durar el episodio
+        """
+        self.max_ticks = max_ticks
+        self.max_score = max_score
+        self.max_seconds = max_seconds
+
+    def deadline(self, deadline=None):
+        """
+        Hora (time.time()) en que se debe cortar un episodio que comienza ahora.
+
+        :param deadline: Hora límite externa, p. ej. la del presupuesto de la generación. Se usa la más temprana
+        """
+        if self.max_seconds is not None:
+            own = pytime.time() + self.max_seconds
+            deadline = own if deadline is None else min(deadline, own)
+        return deadline
+
+    def ticks_reached(self, ticks):
+        return self.max_ticks is not None and ticks >= self.max_ticks
+
+    def score_reached(self, score):
+        """ score puede ser un arreglo de puntajes. Sin límite retorna False """
+        return self.max_score is not None and score >= self.max_score
+
+
+NO_LIMITS = EpisodeLimits()
+
+
+def time_is_up(deadline):
+    return deadline is not None and pytime.time() >= deadline
+
+
+def fall_delta(time):
+    """ Desplazamiento vertical del ave en un cuadro de 'time' milisegundos en que no salta """
+    return .08 * BIRD_ACCEL * time ** 2 * BIRD_SPEED * time
+
+
+def jump_delta(time):
+    """ Desplazamiento vertical (hacia arriba, negativo) del ave en un cuadro en que salta """
+    return -(.2 * BIRD_ACCEL * time ** 2 + BIRD_SPEED * time)
+
+
+def tubes_left_limit(width, tubes_distance):
+    """ Posición izquierda desde la que un par de tubos que salió de la pantalla vuelve a entrar por la derecha """
+    return -(tubes_distance - int(width % tubes_distance))
+
+
+def gap_offsets(bird_x, bird_y, tubes_right, tubes_center):
+    """
+    Desplazamientos (dx, dy_up, dy_down) desde el centro del ave hasta el borde superior derecho del tubo de abajo y
+    el borde inferior derecho del tubo de arriba. Acepta números o arreglos de NumPy
+    """
+    return (tubes_right - bird_x, tubes_center + TubesPairState.HALF_GAP - bird_y,
+            tubes_center - TubesPairState.HALF_GAP - bird_y)
+
+
+def tubes_fitness(score, distance_up, distance_down, height):
+    """ Puntaje más un premio por haber quedado cerca del espacio entre los tubos. Acepta arreglos de NumPy """
+    return score + (1 - ((distance_up + distance_down) / 2) / height)
+
+
+class BirdState:
+    """ Posición del ave. Las dimensiones corresponden a las de game/assets/flappy.png """
+    WIDTH = 70
+    HEIGHT = 66
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.centerx = 0
+        self.centery = 0
+        self.reset()
+
+    def update(self, time, jump):
+        if self.top >= 0 and self.bottom <= self.engine.HEIGHT:  # No se sale por arriba ni por abajo
+            if jump:
+                self.jump(time)
+            else:
+                self.fall(time)
+        elif self.top <= 0:
+            self.fall(time)
+
+    def fall(self, time):
+        self.centery += fall_delta(time)
+
+    def jump(self, time):
+        self.centery += jump_delta(time)
+
+    def reset(self):
+        self.centerx = int(self.engine.WIDTH / 3)
+        self.centery = int(self.engine.HEIGHT * (1 / 3))
+
+    @property
+    def center(self):
+        return self.centerx, self.centery
+
+    @property
+    def left(self):
+        return self.centerx - self.WIDTH / 2
+
+    @property
+    def right(self):
+        return self.centerx + self.WIDTH / 2
+
+    @property
+    def top(self):
+        return self.centery - self.HEIGHT / 2
+
+    @property
+    def bottom(self):
+        return self.centery + self.HEIGHT / 2
+
+
+class TubesPairState:
+    """
+    Par de tubos. 'left' es el borde izquierdo de ambos tubos y 'center' la altura del centro del espacio entre ellos.
+    Las dimensiones corresponden a las de game/assets/tube_up.png y tube_down.png
+    """
+    VERTICAL_GAP = 150
+    HALF_GAP = VERTICAL_GAP // 2
+    WIDTH = 100
+    HEIGHT = 392
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.moving = True
+        self.center = None
+        self.left = self.engine.WIDTH
+        self.set_center()
+
+        # Se usa para calcular cuando reposicionar los tubos al inicio
+        self.left_limit = tubes_left_limit(self.engine.WIDTH, self.engine.TUBES_DISTANCE)
+
+    def update(self, time):
+        # Los tubos siempre se mueven hacia la izquierda
+        if self.moving:
+            self.left -= TUBES_SPEED * time
+        # Si los tubos están a la izquierda fuera de la pantalla se resetean
+        if self.left < self.left_limit:
+            self.reset()
+
+    def reset(self):
+        self.set_xpos(self.engine.WIDTH)
+        self.set_center()
+
+    def set_xpos(self, xpos):
+        self.left = xpos
+
+    def set_center(self):
+        self.center = self.engine.rng.uniform(int(self.engine.HEIGHT * (2 / 5)), int(self.engine.HEIGHT * (3 / 5)))
+
+    @property
+    def right(self):
+        return self.left + self.WIDTH
+
+    @property
+    def up_top(self):
+        """ Borde superior del tubo de abajo """
+        return self.center + self.HALF_GAP
+
+    @property
+    def down_bottom(self):
+        """ Borde inferior del tubo de arriba """
+        return self.center - self.HALF_GAP
+
+    @property
+    def up_rect(self):
+        """ (left, top, right, bottom) del tubo de abajo, en pixeles como lo ubica game.flappy """
+        left, top = pixel(self.left), pixel(self.up_top)
+        return left, top, left + self.WIDTH, top + self.HEIGHT
+
+    @property
+    def down_rect(self):
+        """ (left, top, right, bottom) del tubo de arriba, en pixeles como lo ubica game.flappy """
+        left, bottom = pixel(self.left), pixel(self.down_bottom)
+        return left, bottom - self.HEIGHT, left + self.WIDTH, bottom
+
+
+def rects_overlap(rect1, rect2):
+    """ Indica si dos rectángulos (left, top, right, bottom) se intersectan """
+    return rect1[0] < rect2[2] and rect2[0] < rect1[2] and rect1[1] < rect2[3] and rect2[1] < rect1[3]
+
+
+class FlappyEngine:
+    """
+    Simulación de un episodio de Flappy. Cada llamada a update avanza un cuadro de 'time' milisegundos.
+    Las alturas de los tubos salen de un generador propio, así que un mismo seed y las mismas acciones producen
+    siempre el mismo episodio.
+    """
+    WIDTH = 810
+    HEIGHT = 540
+    TUBES_DISTANCE = 350
+    TUBES_PAIRS = 3
+
+    def __init__(self, seed=None, collision=COLLISION_SHAPE):
+        """
+        :param seed: Semilla del generador de alturas de tubos. Si es None se usa una semilla aleatoria
+        :param collision: COLLISION_SHAPE para choques equivalentes a las máscaras de pygame o COLLISION_BOX para
+                          usar solo los rectángulos de los sprites
+        """
+        assert collision in (COLLISION_BOX, COLLISION_SHAPE)
+        self.collision = collision
+        self.hitboxes = load_hitboxes() if collision == COLLISION_SHAPE else None
+        self.rng = random.Random(seed)
+        self.bird = BirdState(self)
+        self.tubes_pairs = []
+        self.score = 0
+        self.next_tubes = 0
+        self.ticks = 0
+        self.crashed = False
+        self.truncated = False
+        self.init_tubes()
+
+    def init_tubes(self):
+        for i in range(self.TUBES_PAIRS):
+            self.tubes_pairs.append(TubesPairState(self))
+            # Se separan los tubos horizontalmente
+            self.tubes_pairs[-1].set_xpos(int(self.WIDTH + self.TUBES_DISTANCE * i))
+
+    def reset(self, seed=None):
+        """
+        :param seed: Si no es None se reinicia el generador de tubos con esta semilla
+        """
+        if seed is not None:
+            self.rng.seed(seed)
+        self.bird.reset()
+        self.score = 0
+        self.next_tubes = 0
+        self.ticks = 0
+        self.crashed = False
+        self.truncated = False
+        # Se reutilizan los pares de tubos; se sortean en el mismo orden que al crearlos
+        for i, tubes in enumerate(self.tubes_pairs):
+            tubes.set_xpos(int(self.WIDTH + self.TUBES_DISTANCE * i))
+            tubes.set_center()
+
+    def update(self, time, jump):
+        """ Avanza la simulación un cuadro sin revisar choques """
+        self.bird.update(time, jump)
+        for tubes in self.tubes_pairs:
+            tubes.update(time)
+        self.update_score()
+        self.ticks += 1
+
+    def step(self, jump, time=FRAME_TIME):
+        """
+        Avanza un cuadro y revisa choques.
+
+        :return: True si el ave sigue viva
+        """
+        self.update(time, jump)
+        if self.check_collision():
+            self.crashed = True
+        return not self.crashed
+
+    def check_limits(self, limits, deadline=None):
+        """
+        Corta el episodio si el ave sigue viva y se alcanzó algún límite.
+
+        :param limits: EpisodeLimits con los límites de cuadros y puntaje
+        :param deadline: Hora límite (ver EpisodeLimits.deadline)
+        :return: True si el episodio quedó truncado
+        """
+        if not self.crashed and not self.truncated:
+            self.truncated = (limits.ticks_reached(self.ticks) or limits.score_reached(self.score) or
+                              time_is_up(deadline))
+        return self.truncated
+
+    @property
+    def done(self):
+        return self.crashed or self.truncated
+
+    def result(self):
+        return EpisodeResult(self.get_fitness(), self.score, self.ticks, self.truncated)
+
+    def update_score(self):
+        # Los tubos que estaban al frente ahora están atrás del ave
+        if self.tubes_pairs[self.next_tubes].right < self.bird.left:
+            # Se anota un punto
+            self.score += 1
+            # Se actualiza el next
+            self.next_tubes = int((self.next_tubes + 1) % self.TUBES_PAIRS)
+
+    def bird_rect(self):
+        """ (left, top, right, bottom) del ave en pixeles. pygame redondea el centro antes de calcular los bordes """
+        left = pixel(self.bird.centerx) - BirdState.WIDTH // 2
+        top = pixel(self.bird.centery) - BirdState.HEIGHT // 2
+        return left, top, left + BirdState.WIDTH, top + BirdState.HEIGHT
+
+    def check_collision(self):
+        """ Choque del ave con los tubos del frente o con el suelo """
+        bird = self.bird_rect()
+        if bird[3] > self.HEIGHT:
+            return True
+
+        tubes = self.tubes_pairs[self.next_tubes]
+        up_rect, down_rect = tubes.up_rect, tubes.down_rect
+        hit_up = rects_overlap(bird, up_rect)
+        hit_down = rects_overlap(bird, down_rect)
+        if self.collision == COLLISION_BOX or not (hit_up or hit_down):
+            return hit_up or hit_down
+
+        # Los rectángulos se tocan, se revisa la forma de los sprites
+        bird_hitbox = self.hitboxes['bird']
+        return ((hit_up and self.hitboxes['tube_up'].overlaps(up_rect[0], up_rect[1], bird_hitbox, bird[0], bird[1])) or
+                (hit_down and self.hitboxes['tube_down'].overlaps(down_rect[0], down_rect[1], bird_hitbox,
+                                                                  bird[0], bird[1])))
+
+    def get_distances(self):
+        """
+        Retorna las siguientes distancias desde el centro del player:
+
+        1. Distancia al suelo
+        2. Distancia al borde superior derecho del tubo que viene por abajo
+        3. Distancia al borde inferior derecho del tube que viene por arriba
+        """
+        tubes = self.tubes_pairs[self.next_tubes]
+        dx, dy_up, dy_down = gap_offsets(self.bird.centerx, self.bird.centery, tubes.right, tubes.center)
+        return self.HEIGHT - self.bird.centery, math.hypot(dx, dy_up), math.hypot(dx, dy_down)
+
+    def get_fitness(self):
+        """ Puntaje más un premio por haber quedado cerca del espacio entre los tubos """
+        distances = self.get_distances()
+        return tubes_fitness(self.score, distances[1], distances[2], self.HEIGHT)
+
+
+def play_episode(player, seed=None, engine=None, limits=NO_LIMITS, deadline=None):
+    """
+    Hace jugar un episodio completo sin ventana ni límite de FPS, con pasos fijos de FRAME_TIME.
+
+    :param player: Objeto con método feed_forward(distancias) como NeuralNetwork
+    :param seed: Semilla de los tubos del episodio. El mismo jugador con el mismo seed obtiene el mismo fitness
+    :param engine: FlappyEngine a usar. Si es None se crea uno nuevo
+    :param limits: EpisodeLimits para cortar el episodio aunque el ave no choque
+    :param deadline: Hora (time.time()) en que se corta el episodio, además de limits.max_seconds
+    :return: EpisodeResult del episodio
+    """
+    if engine is None:
+        engine = FlappyEngine(seed)
+    else:
+        engine.reset(seed)
+    deadline = limits.deadline(deadline)
+
+    while not engine.check_limits(limits, deadline):
+        jump = player.feed_forward(engine.get_distances())[0] > JUMP_THRESHOLD
+        if not engine.step(jump):
+            break
+    return engine.result()
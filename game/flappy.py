@@ -1,123 +1,70 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import warnings
+
 import pygame
-import random
-import math
-from datetime import datetime
 from pygame.locals import *
+from queue import Empty as EmptyQueue
 
-random.seed(datetime.now().second)
-
-
-def load_image(filename):
-    try:
-        image = pygame.image.load(filename).convert_alpha()
-    except pygame.error as message:
-        raise SystemExit(message)
-    return image
-
-
-def distance(point1, point2):
-    return math.sqrt(math.pow(point2[0] - point1[0], 2) + math.pow(point2[1] - point1[1], 2))
+from game.engine import FlappyEngine, FRAME_TIME, NO_LIMITS
+from game.render import Renderer
+from game.resources import ASSETS
+from game.channel import Actions
 
 
 class FlappySprite(pygame.sprite.Sprite):
+    """ Dibuja el estado del ave del motor """
 
     def __init__(self, game):
         pygame.sprite.Sprite.__init__(self)
         self.game = game  # A reference to the container game
-        self.image = load_image("game/assets/flappy.png")
+        self.state = game.engine.bird
+        self.image = ASSETS.image('flappy.png')
         self.rect = self.image.get_rect()
-        self.rect.centerx = self.game.WIDTH / 3
-        self.rect.centery = int(self.game.HEIGHT * (1 / 3))
-        self.speed = 0.1
-        self.accel = 0.1
-        self.mask = pygame.mask.from_surface(self.image)
-
-    def update(self, time, keys):
-        if self.rect.top >= 0 and self.rect.bottom <= self.game.HEIGHT:  # No se sale por arriba ni por abajo
-            if keys[K_SPACE]:
-                self.jump(time)
-            else:
-                self.fall(time)
-        elif self.rect.top <= 0:
-            self.fall(time)
-
-    def fall(self, time):
-        self.rect.centery += .08 * self.accel * time ** 2 * self.speed * time
-
-    def jump(self, time):
-        self.rect.centery -= .2 * self.accel * time ** 2 + self.speed * time
+        self.mask = ASSETS.mask('flappy.png')
+        self.update()
 
-    def reset(self):
-        self.rect.centerx = self.game.WIDTH / 3
-        self.rect.centery = int(self.game.HEIGHT * (1 / 3))
+    def update(self, *args):
+        self.rect.center = self.state.center
 
 
 class TubeSprite(pygame.sprite.Sprite):
     UP = 0
     DOWN = 1
+    IMAGES = {UP: 'tube_up.png', DOWN: 'tube_down.png'}
 
     def __init__(self, type):
         pygame.sprite.Sprite.__init__(self)
-        if type == TubeSprite.UP:
-            self.image = load_image('game/assets/tube_up.png')
-        elif type == TubeSprite.DOWN:
-            self.image = load_image('game/assets/tube_down.png')
+        self.image = ASSETS.image(TubeSprite.IMAGES[type])
         self.rect = self.image.get_rect()
-        self.speed = 0.2
-        self.moving = True
-        self.mask = pygame.mask.from_surface(self.image)
-
-    def update(self, time):
-        # Los tubos siempre se mueven hacia la izquierda
-        if self.moving:
-            self.rect.centerx -= self.speed * time
+        self.mask = ASSETS.mask(TubeSprite.IMAGES[type])
 
 
 class TubesPair:
-    VERTICAL_GAP = 150
+    """ Dibuja un par de tubos del motor. Los pares se reutilizan entre episodios cambiando su state (ver bind) """
 
-    def __init__(self, game):
+    def __init__(self, game, state):
         self.game = game
+        self.state = state
         self.tube_up = TubeSprite(TubeSprite.UP)
         self.tube_down = TubeSprite(TubeSprite.DOWN)
-
-        self.center = None
-
-        self.set_center()
-
-        # Ambos parten a la derecha
-        self.tube_up.rect.left = self.game.WIDTH
-        self.tube_down.rect.left = self.game.WIDTH
-
         self.group = pygame.sprite.Group(self.tube_up, self.tube_down)
+        self.update()
 
-        # Se usa para calcular cuando reposicionar los tubos al inicio
-        self.left_limit = -(self.game.TUBES_DISTANCE - int(self.game.WIDTH % self.game.TUBES_DISTANCE))
+    def bind(self, state):
+        """ Pasa a dibujar el TubesPairState state """
+        self.state = state
+        self.update()
 
     def update(self, *args):
-        self.group.update(*args)
-        # Si los tubos están a la izquierda fuera de la pantalla se resetean
-        if self.tube_up.rect.left < self.left_limit:
-            self.reset()
+        self.tube_up.rect.left = self.state.left
+        self.tube_down.rect.left = self.state.left
+        self.tube_up.rect.top = self.state.up_top
+        self.tube_down.rect.bottom = self.state.down_bottom
 
     def get_group(self):
         return self.group
 
-    def reset(self):
-        self.set_xpos(self.game.WIDTH)
-        self.set_center()
-
-    def set_xpos(self, xpos):
-        self.tube_up.rect.left = xpos
-        self.tube_down.rect.left = xpos
-
-    def set_center(self):
-        self.center = random.uniform(int(self.game.HEIGHT * (2 / 5)), int(self.game.HEIGHT * (3 / 5)))
-        self.tube_up.rect.top = self.center + int(self.VERTICAL_GAP / 2)
-        self.tube_down.rect.bottom = self.center - int(self.VERTICAL_GAP / 2)
-
 
 class GameStates:
     START = 0
@@ -126,20 +73,41 @@ class GameStates:
 
 
 class FlappyGame:
-    WIDTH = 810
-    HEIGHT = 540
-    TUBES_DISTANCE = 350
-    TUBES_PAIRS = 3
-
-    def __init__(self):
+    """
+    Visualizador de FlappyEngine. Las reglas del juego viven en el motor; esta clase maneja la ventana, el teclado y
+    el dibujo.
+    """
+    WIDTH = FlappyEngine.WIDTH
+    HEIGHT = FlappyEngine.HEIGHT
+    TUBES_DISTANCE = FlappyEngine.TUBES_DISTANCE
+    TUBES_PAIRS = FlappyEngine.TUBES_PAIRS
+
+    def __init__(self, seed=None, validate_collisions=False, limits=NO_LIMITS, recorder=None, render_every=1):
+        """
+        :param seed: Semilla de los tubos (ver FlappyEngine)
+        :param limits: EpisodeLimits (game.engine). Al alcanzar un límite el episodio pasa a RESET como si el ave
+                       hubiera chocado, pero engine.truncated queda en True
+        :param recorder: Objeto con record_frame(engine, salto) que se llama antes de cada cuadro jugado, como
+                         game.trace.TraceWriter
+        :param render_every: Mientras se juega solo se dibuja uno de cada render_every cuadros. Con el límite de FPS
+                             la simulación avanza render_every cuadros por cuadro dibujado
+        :param validate_collisions: Compara en cada cuadro los choques del motor con los de las máscaras de pygame y
+                                    cuenta las diferencias en collision_mismatches
+        """
+        self.engine = FlappyEngine(seed)
+        self.validate_collisions = validate_collisions
+        self.collision_mismatches = 0
+        self.limits = limits
+        self.episode_deadline = None
+        self.recorder = recorder
+        self.render_every = render_every
+        self.renderer = None
         self.background = None
         self.screen = None
         self.player = None
         self.tubes_pairs = []
-        self.score = 0
         self.clock = None
         self.is_executing = False
-        self.next_tubes = 0
         self.font = None
         self.state = GameStates.START
         self.ground = None
@@ -150,11 +118,12 @@ class FlappyGame:
         pygame.font.init()
         self.screen = pygame.display.set_mode((self.WIDTH, self.HEIGHT), HWSURFACE | DOUBLEBUF | RESIZABLE)
         pygame.display.set_caption("Flappy IA")
-        self.background = load_image('game/assets/background.png')
+        self.background = ASSETS.image('background.png')
         self.player = FlappySprite(self)
         self.clock = pygame.time.Clock()
         self.is_executing = True
-        self.font = pygame.font.Font('game/assets/ARCADECLASSIC.TTF', 30)
+        self.font = ASSETS.font('ARCADECLASSIC.TTF', 30)
+        self.renderer = Renderer(self.screen, self.background, self.font)
         self.init_tubes()
 
         # Un sprite invisible para el suelo
@@ -163,95 +132,230 @@ class FlappyGame:
         self.ground.rect = self.ground.image.get_rect(topleft=(0, self.HEIGHT))
 
     def init_tubes(self):
-        for i in range(self.TUBES_PAIRS):
-            self.tubes_pairs.append(TubesPair(self))
-            # Se separan los tubos horizontalmente
-            self.tubes_pairs[-1].set_xpos(int(self.WIDTH + self.TUBES_DISTANCE * i))
+        """ Asocia un TubesPair a cada par de tubos del motor. Los TubesPair ya creados se reutilizan """
+        for i, tubes_state in enumerate(self.engine.tubes_pairs):
+            if i < len(self.tubes_pairs):
+                self.tubes_pairs[i].bind(tubes_state)
+            else:
+                self.tubes_pairs.append(TubesPair(self, tubes_state))
+        del self.tubes_pairs[len(self.engine.tubes_pairs):]
+
+    @property
+    def score(self):
+        return self.engine.score
+
+    @property
+    def next_tubes(self):
+        return self.engine.next_tubes
+
+    def execute(self, state_queue=None, actions_queue=None, channel=None, lockstep=False):
+        """
+        Loop principal del juego.
+
+        :param state_queue: Cola donde se publica el estado de cada cuadro
+        :param actions_queue: Cola desde donde se leen las teclas presionadas por el agente
+        :param channel: SharedChannel (game.channel) usado en lugar de las colas
+        :param lockstep: Si es True (requiere channel) el juego espera la acción del agente para cada cuadro y avanza
+                         un cuadro fijo por acción, sin límite de FPS
+        """
+        if lockstep:
+            assert channel is not None
+            self.execute_lockstep(channel)
+            return
 
-    def execute(self, state_queue=None, actions_queue=None):
         self.init_engine()
 
         while self.is_executing:
-            time = self.clock.tick(60)
-            # Obtiene el input desde la cola de acciones o desde el teclado
-            if actions_queue is not None:
+            time = FRAME_TIME
+            # Obtiene el input desde el agente o desde el teclado
+            if channel is not None:
+                keys = self.read_channel_keys(channel)
+            elif actions_queue is not None:
                 try:
                     keys = actions_queue.get(block=False)
-                except Exception as e:
+                except EmptyQueue:
                     keys = self.get_keys()
             else:
                 keys = self.get_keys()
             for events in pygame.event.get():
                 self.handle_event(events, keys)
+            # Las acciones del agente llegan sin un evento de pygame asociado
+            self.handle_keys(keys)
 
             if state_queue is not None:
                 self.log_into_queue(state_queue)
+            if channel is not None:
+                self.log_into_channel(channel)
 
             if self.state == GameStates.PLAYING:
                 self.update_state(time, keys)
                 self.check_player_collision()
-                self.draw_playing_screen()
-            elif self.state == GameStates.START:
-                self.draw_start_screen()
-            elif self.state == GameStates.RESET:
-                self.draw_reset_screen()
-            pygame.display.flip()
+                self.check_limits()
+            if self.frame_due():
+                self.render_frame()
+                # El reloj solo limita los FPS; la física avanza siempre un cuadro fijo para ser determinista
+                self.clock.tick(60)
 
-        pygame.display.quit()
+        self.quit()
+
+    def execute_lockstep(self, channel, action_timeout=.5):
+        """
+        Loop principal sincronizado con el agente: cada cuadro publicado en channel espera su respuesta antes de
+        avanzar, así el resultado no depende de la velocidad del agente.
+        """
+        self.init_engine()
+
+        while self.is_executing:
+            self.handle_events()
+
+            # Siempre se publica un cuadro, incluso si el agente no reseteó al recibir RESET
+            self.process_msg()
+            frame_seq = self.write_into_channel(channel, self.last_process_msg)
+
+            action = None
+            while action is None and self.is_executing:
+                action = channel.wait_action(frame_seq, timeout=action_timeout)
+                if action is None:
+                    self.handle_events()
+            if action is None:
+                break
+
+            if self.state == GameStates.PLAYING:
+                self.step(action)
+                continue
+
+            self.handle_keys(self.action_keys(action))
+            self.render_frame()
+
+        self.quit()
+
+    def step(self, action, time=FRAME_TIME, render=True):
+        """
+        Avanza exactamente un cuadro de 'time' milisegundos. No depende del reloj, así que puede llamarse tan rápido
+        como el agente decida. Si el juego no se ha iniciado con init_engine se simula sin dibujar.
+
+        :param action: Acción de game.channel.Actions o un booleano que indica si el ave salta
+        :param render: Dibuja el cuadro si hay ventana
+        :return: (distancias, recompensa, terminado). La suma de las recompensas de un episodio es su fitness
+        """
+        assert self.state == GameStates.PLAYING, 'El juego debe estar en PLAYING, usar reset()'
+        score = self.score
+        self.update_state(time, self.action_keys(action))
+        self.check_player_collision()
+        self.check_limits()
+
+        done = self.state == GameStates.RESET
+        reward = self.score - score
+        if done:
+            reward += self.engine.get_fitness() - self.score
+
+        if render and self.screen is not None and self.frame_due():
+            self.render_frame()
+        return self.get_distances(), reward, done
 
     def update_state(self, time, keys):
-        self.player.update(time, keys)
+        if self.recorder is not None:
+            self.recorder.record_frame(self.engine, keys[K_SPACE])
+        self.engine.update(time, keys[K_SPACE])
+        self.sync_sprites()
+
+    def sync_sprites(self):
+        """ Los sprites copian la posición calculada por el motor. No hace nada si no hay ventana """
+        if self.player is None:
+            return
+        self.player.update()
         for tubes in self.tubes_pairs:
-            tubes.update(time)
-        # update score
-        self.update_score()
-
-    def update_score(self):
-        # Los tubos que estaban al frente ahora están atrás del ave
-        if self.tubes_pairs[self.next_tubes].tube_up.rect.right < self.player.rect.left:
-            # Se anota un punto
-            self.score += 1
-            # Se actualiza el next
-            self.next_tubes = int((self.next_tubes + 1) % self.TUBES_PAIRS)
+            tubes.update()
+
+    def frame_due(self):
+        """ Indica si el cuadro actual se dibuja. Fuera de PLAYING siempre se dibuja """
+        return self.state != GameStates.PLAYING or self.engine.ticks % self.render_every == 0
+
+    def render_frame(self):
+        """ Dibuja la pantalla del estado actual y la muestra """
+        if self.state == GameStates.PLAYING:
+            self.draw_playing_screen()
+        elif self.state == GameStates.START:
+            self.draw_start_screen()
+        elif self.state == GameStates.RESET:
+            self.draw_reset_screen()
+        self.renderer.present()
 
     def draw_playing_screen(self):
-        self.screen.blit(pygame.transform.scale(self.background, (self.WIDTH, self.HEIGHT)), (0, 0))
-        self.screen.blit(self.player.image, self.player.rect)
+        self.renderer.begin()
+        self.renderer.blit(self.player.image, self.player.rect)
         for tubes in self.tubes_pairs:
-            tubes.get_group().draw(self.screen)
+            for sprite in tubes.get_group():
+                self.renderer.blit(sprite.image, sprite.rect)
         self.draw_score()
         self.place_ground()
 
     def draw_score(self):
-        s = self.font.render('Score  {}'.format(self.score), True, (255, 255, 255))
-        self.screen.blit(s, (10, 10))
+        self.renderer.blit(self.renderer.text('Score  {}'.format(self.score), (255, 255, 255)), (10, 10))
 
     def check_player_collision(self):
-        if (pygame.sprite.spritecollideany(self.player,
-                                           self.tubes_pairs[self.next_tubes].group,
-                                           collided=pygame.sprite.collide_mask) or
-                pygame.sprite.collide_rect(self.player, self.ground)):
+        collision = self.engine.check_collision()
+        if self.validate_collisions and self.player is not None:
+            mask_collision = bool(pygame.sprite.spritecollideany(self.player,
+                                                                 self.tubes_pairs[self.next_tubes].group,
+                                                                 collided=pygame.sprite.collide_mask) or
+                                  pygame.sprite.collide_rect(self.player, self.ground))
+            if mask_collision != collision:
+                self.collision_mismatches += 1
+                warnings.warn('Choque del motor ({}) distinto al de las máscaras ({}) en el cuadro {}'.format(
+                    collision, mask_collision, self.engine.ticks))
+        if collision:
             self.game_over()
 
-    def reset(self):
-        self.player.reset()
-        self.score = 0
-        self.next_tubes = 0
-        self.tubes_pairs.clear()
-        self.init_tubes()
+    def check_limits(self):
+        """ Termina el episodio si el ave sigue viva y se alcanzó un límite de self.limits """
+        if self.state == GameStates.PLAYING and self.engine.check_limits(self.limits, self.episode_deadline):
+            self.state = GameStates.RESET
+
+    def start_playing(self):
+        self.episode_deadline = self.limits.deadline()
         self.state = GameStates.PLAYING
+        if self.renderer is not None:
+            self.renderer.invalidate()
+
+    def reset(self, seed=None):
+        """
+        Comienza un episodio nuevo y retorna las distancias iniciales.
+
+        :param seed: Semilla de los tubos del episodio. Si es None se continúa con el generador actual
+        """
+        self.engine.reset(seed)
+        if self.player is not None:
+            self.player.update()
+            self.init_tubes()
+        self.start_playing()
+        return self.get_distances()
 
     def game_over(self):
+        self.engine.crashed = True
         self.state = GameStates.RESET
 
     def handle_event(self, events, keys):
         if events.type == QUIT:
             self.is_executing = False
+        elif events.type == VIDEORESIZE and self.renderer is not None:
+            self.renderer.resize(events.size)
+
+    @staticmethod
+    def quit():
+        pygame.display.quit()
+
+    def handle_events(self):
+        """ Atiende los eventos de la ventana cuando las teclas no vienen del teclado """
+        for events in pygame.event.get():
+            self.handle_event(events, None)
+
+    def handle_keys(self, keys):
         if keys[K_RETURN]:
             if self.state == GameStates.RESET:
                 self.reset()
             elif self.state == GameStates.START:
-                self.state = GameStates.PLAYING
+                self.start_playing()
 
     @staticmethod
     def get_keys():
@@ -265,40 +369,83 @@ class FlappyGame:
         2. Distancia al borde superior derecho del tubo que viene por abajo
         3. Distancia al borde inferior derecho del tube que viene por arriba
         """
-        return (self.HEIGHT - self.player.rect.centery,
-                distance(self.player.rect.center, self.tubes_pairs[self.next_tubes].tube_up.rect.topright),
-                distance(self.player.rect.center, self.tubes_pairs[self.next_tubes].tube_down.rect.bottomright))
+        return self.engine.get_distances()
 
     def draw_start_screen(self):
-        s = self.font.render("Presiona  INTRO  para  iniciar  el  juego", True, (255, 255, 255))
-        self.screen.blit(s, s.get_rect(center=(self.WIDTH / 2, self.HEIGHT / 2)))
+        self.renderer.overlay("Presiona  INTRO  para  iniciar  el  juego", (255, 255, 255),
+                              (self.WIDTH / 2, self.HEIGHT / 2))
 
     def draw_reset_screen(self):
-        s = self.font.render("Juego  terminado  tu  puntaje  fue  {}".format(self.score), True, (0, 0, 0))
-        self.screen.blit(s, s.get_rect(center=(self.WIDTH / 2, self.HEIGHT / 2)))
+        self.renderer.overlay("Juego  terminado  tu  puntaje  fue  {}".format(self.score), (0, 0, 0),
+                              (self.WIDTH / 2, self.HEIGHT / 2))
 
     def place_ground(self):
-        self.screen.blit(self.ground.image, self.ground.rect)
-
-    def log_into_queue(self, queue):
+        self.renderer.blit(self.ground.image, self.ground.rect)
 
+    def process_msg(self):
+        """
+        Mensaje para el agente en el cuadro actual: (estado, distancias) al jugar, (estado, None) al inicio y
+        (estado, fitness) al perder. Retorna None si no hay nada que informar.
+        """
         if self.state == GameStates.PLAYING:
             self.last_process_msg = (self.state, self.get_distances())
-            queue.put(self.last_process_msg)
         elif self.state == GameStates.START:
             self.last_process_msg = (self.state, None)
-            queue.put(self.last_process_msg)
         elif self.state == GameStates.RESET:
-            if self.last_process_msg[0] == GameStates.PLAYING:
-                distances = self.get_distances()
-                distance_to_tubes_score = 1 - ((distances[1] + distances[2])/2)/self.HEIGHT
-                self.last_process_msg = (self.state, self.score + distance_to_tubes_score)
-                queue.put(self.last_process_msg)
+            if self.last_process_msg[0] != GameStates.PLAYING:
+                return None
+            self.last_process_msg = (self.state, self.engine.get_fitness())
+        return self.last_process_msg
+
+    def log_into_queue(self, queue):
+        msg = self.process_msg()
+        if msg is not None:
+            queue.put(msg)
+
+    def log_into_channel(self, channel):
+        msg = self.process_msg()
+        if msg is not None:
+            return self.write_into_channel(channel, msg)
+
+    def write_into_channel(self, channel, msg):
+        """ Escribe un mensaje de process_msg en channel y retorna su número de secuencia """
+        state, data = msg
+        if state == GameStates.PLAYING:
+            return channel.write(state, distances=data, score=self.score)
+        elif state == GameStates.RESET:
+            return channel.write(state, score=data)
+        return channel.write(state)
+
+    @staticmethod
+    def action_keys(action):
+        """ Convierte una acción de Actions (o un booleano de salto) en el diccionario de teclas """
+        action = int(action)
+        return {K_SPACE: action & Actions.JUMP, K_RETURN: action & Actions.ENTER}
+
+    @staticmethod
+    def read_channel_keys(channel):
+        """ Teclas de la última acción del agente. Si el agente no ha respondido se usa el teclado """
+        action = channel.read_action()
+        if action is None:
+            return FlappyGame.get_keys()
+        _, action = action
+        return FlappyGame.action_keys(action)
 
 
 
 
 
 if __name__ == '__main__':
-    game = FlappyGame()
+    import argparse
+    from game.trace import TraceWriter
+
+    parser = argparse.ArgumentParser(description='Flappy con el teclado')
+    parser.add_argument('--trace', default=None, help='Directorio del historial cuadro a cuadro (ver game.trace)')
+    args = parser.parse_args()
+
+    trace_recorder = TraceWriter(args.trace) if args.trace is not None else None
+    game = FlappyGame(recorder=trace_recorder)
     game.execute()
+    if trace_recorder is not None:
+        trace_recorder.close()
+        print('{} cuadros grabados en {}'.format(trace_recorder.recorded, args.trace))
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+Formas de choque geométricas del ave y los tubos.
+
+Cada forma guarda, por cada fila de pixeles del sprite, el intervalo [left, right) ocupado por su máscara. Dos formas
+chocan si en alguna fila compartida sus intervalos se intersectan. Es equivalente a pygame.sprite.collide_mask salvo
+por los huecos dentro de una misma fila, que se consideran llenos (nunca se pierde un choque).
+
+Las formas se generan una vez desde los PNG con `python -m game.hitbox` y se guardan en game/assets/hitbox.json, así
+el motor no necesita pygame para usarlas.
+"""
+import json
+import math
+import os
+
+import numpy as np
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets')
+HITBOX_FILE = os.path.join(ASSETS_DIR, 'hitbox.json')
+SPRITES = {'bird': 'flappy.png', 'tube_up': 'tube_up.png', 'tube_down': 'tube_down.png'}
+
+
+def pixel(value):
+    """ Redondea una coordenada como pygame.Rect: al entero más cercano, con las mitades lejos de cero """
+    magnitude = abs(value)
+    rounded = math.floor(magnitude)
+    if magnitude - rounded >= .5:
+        rounded += 1
+    return rounded if value >= 0 else -rounded
+
+
+def pixels(values):
+    """ Versión vectorizada de pixel. Retorna un arreglo de enteros """
+    magnitude = np.abs(values)
+    rounded = np.floor(magnitude)
+    rounded += magnitude - rounded >= .5
+    return np.copysign(rounded, values).astype(int)
+
+
+class Hitbox:
+
+    def __init__(self, width, height, left, right):
+        """
+        :param left: Por fila, primer pixel ocupado. Las filas vacías tienen left >= right
+        :param right: Por fila, pixel siguiente al último ocupado
+        """
+        self.width = width
+        self.height = height
+        self.left = np.asarray(left, dtype=int)
+        self.right = np.asarray(right, dtype=int)
+        # Copias en listas para el motor escalar, que es más rápido sin indexar arreglos de numpy
+        self.left_list = self.left.tolist()
+        self.right_list = self.right.tolist()
+
+    def overlaps(self, x, y, other, other_x, other_y):
+        """
+        Indica si esta forma en (x, y) choca con other en (other_x, other_y). Las posiciones son las esquinas
+        superiores izquierdas de los sprites y se redondean a pixeles con pixel. Un sprite ubicado por su centro o su
+        borde inferior debe redondearse antes de restar su tamaño, como hace pygame.
+        """
+        dx = pixel(other_x) - pixel(x)
+        dy = pixel(other_y) - pixel(y)
+        first = max(0, dy)
+        last = min(self.height, dy + other.height)
+        for row in range(first, last):
+            other_row = row - dy
+            if (max(self.left_list[row], other.left_list[other_row] + dx) <
+                    min(self.right_list[row], other.right_list[other_row] + dx)):
+                return True
+        return False
+
+    def overlaps_many(self, x, y, other, other_x, other_y):
+        """
+        Versión vectorizada de overlaps para muchas formas other con la misma posición horizontal.
+
+        :param other_y: Arreglo con la posición vertical de cada forma other
+        :param y: Número o arreglo del mismo tamaño que other_y
+        :return: Arreglo de booleanos
+        """
+        dx = pixel(other_x) - pixel(x)
+        dy = pixels(other_y) - pixels(y)
+        rows = dy[:, np.newaxis] + np.arange(other.height)
+        inside = (rows >= 0) & (rows < self.height)
+        rows = np.clip(rows, 0, self.height - 1)
+        left = np.maximum(self.left[rows], other.left + dx)
+        right = np.minimum(self.right[rows], other.right + dx)
+        return (inside & (left < right)).any(axis=1)
+
+
+def mask_hitbox(mask):
+    """ Hitbox a partir de un pygame.mask.Mask """
+    width, height = mask.get_size()
+    left, right = [width] * height, [0] * height
+    for row in range(height):
+        columns = [x for x in range(width) if mask.get_at((x, row))]
+        if columns:
+            left[row], right[row] = columns[0], columns[-1] + 1
+    return Hitbox(width, height, left, right)
+
+
+def build_hitboxes(path=HITBOX_FILE):
+    """ Genera el archivo de formas desde las imágenes. Requiere pygame """
+    import pygame
+
+    data = {}
+    for name, filename in SPRITES.items():
+        mask = pygame.mask.from_surface(pygame.image.load(os.path.join(ASSETS_DIR, filename)))
+        hitbox = mask_hitbox(mask)
+        data[name] = {'width': hitbox.width, 'height': hitbox.height,
+                      'left': hitbox.left_list, 'right': hitbox.right_list}
+    with open(path, 'w') as f:
+        json.dump(data, f, separators=(',', ':'))
+
+
+_hitboxes = None
+
+
+def load_hitboxes(path=HITBOX_FILE):
+    """ Diccionario nombre -> Hitbox. Se lee una sola vez por proceso """
+    global _hitboxes
+    if _hitboxes is None:
+        with open(path) as f:
+            _hitboxes = {name: Hitbox(**values) for name, values in json.load(f).items()}
+    return _hitboxes
+
+
+if __name__ == '__main__':
+    build_hitboxes()
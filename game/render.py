@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Capa de dibujo de la ventana con actualización por rectángulos sucios.
+
+El fondo se escala una sola vez (y de nuevo al cambiar el tamaño de la ventana), los textos se renderizan una vez por
+contenido y en cada cuadro solo se actualizan en pantalla los rectángulos donde algo se dibujó o se borró, en lugar
+de la ventana completa.
+"""
+import pygame
+
+# Textos distintos que se guardan antes de vaciar el caché
+MAX_TEXTS = 512
+
+
+class Renderer:
+
+    def __init__(self, screen, background, font):
+        """
+        :param screen: Superficie de la ventana
+        :param background: Imagen de fondo en su tamaño original
+        :param font: pygame.font.Font de los textos
+        """
+        self.screen = screen
+        self.source_background = background
+        self.font = font
+        self.background = None
+        self.texts = {}
+        # Rectángulos dibujados en el cuadro actual y en el anterior. Los del anterior se borran con el fondo
+        self.dirty = []
+        self.previous = []
+        # Textos fijos ya dibujados sobre el cuadro actual (ver overlay)
+        self.overlays = set()
+        self.full_redraw = True
+        self.resize(screen.get_size())
+
+    def resize(self, size):
+        self.screen = pygame.display.get_surface() or self.screen
+        self.background = pygame.transform.scale(self.source_background, size).convert()
+        self.invalidate()
+
+    def invalidate(self):
+        """ El próximo cuadro se dibuja y se muestra completo """
+        self.full_redraw = True
+        self.previous = []
+        self.overlays.clear()
+
+    def text(self, text, color):
+        """ Superficie con text renderizado. Se renderiza solo la primera vez """
+        key = (text, color)
+        surface = self.texts.get(key)
+        if surface is None:
+            if len(self.texts) >= MAX_TEXTS:
+                self.texts.clear()
+            surface = self.texts[key] = self.font.render(text, True, color)
+        return surface
+
+    def begin(self):
+        """ Comienza un cuadro: borra con el fondo lo dibujado en el cuadro anterior """
+        if self.full_redraw:
+            self.screen.blit(self.background, (0, 0))
+        else:
+            for rect in self.previous:
+                self.screen.blit(self.background, rect, rect)
+        self.overlays.clear()
+
+    def blit(self, surface, position):
+        """ Dibuja surface y marca su rectángulo para borrarlo en el cuadro siguiente """
+        rect = self.screen.blit(surface, position)
+        self.dirty.append(rect)
+        return rect
+
+    def overlay(self, text, color, center):
+        """
+        Dibuja un texto fijo sobre lo que ya hay en pantalla, sin borrar. Si el mismo texto ya se dibujó desde el
+        último begin o invalidate no se vuelve a dibujar
+        """
+        if (text, color) in self.overlays:
+            return
+        self.overlays.add((text, color))
+        surface = self.text(text, color)
+        self.dirty.append(self.screen.blit(surface, surface.get_rect(center=center)))
+
+    def present(self):
+        """ Muestra en la ventana lo dibujado desde el último present """
+        if self.full_redraw:
+            pygame.display.flip()
+            self.full_redraw = False
+        elif self.previous or self.dirty:
+            pygame.display.update(self.previous + self.dirty)
+        self.previous = self.dirty
+        self.dirty = []
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+Caché de imágenes, máscaras y fuentes de game/assets.
+
+Cada recurso se carga del disco la primera vez que se pide y se reutiliza en el resto del proceso, así crear sprites
+o reiniciar un episodio no vuelve a leer los PNG ni a calcular las máscaras. Nada se carga al importar el módulo: la
+simulación sin ventana (game.engine, game.batch) nunca lo usa y no paga ningún costo.
+
+Las imágenes se convierten al formato de la ventana, así que deben pedirse después de pygame.display.set_mode.
+"""
+import os
+
+import pygame
+
+from game.hitbox import ASSETS_DIR
+
+
+class AssetCache:
+
+    def __init__(self, directory=ASSETS_DIR):
+        self.directory = directory
+        self.images = {}
+        self.masks = {}
+        self.fonts = {}
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def image(self, name):
+        """ Imagen name con canal alfa. Las superficies son compartidas: no deben modificarse """
+        image = self.images.get(name)
+        if image is None:
+            try:
+                image = self.images[name] = pygame.image.load(self.path(name)).convert_alpha()
+            except pygame.error as message:
+                raise SystemExit(message)
+        return image
+
+    def mask(self, name):
+        """ pygame.mask.Mask de la imagen name """
+        mask = self.masks.get(name)
+        if mask is None:
+            mask = self.masks[name] = pygame.mask.from_surface(self.image(name))
+        return mask
+
+    def font(self, name, size):
+        key = (name, size)
+        font = self.fonts.get(key)
+        if font is None:
+            font = self.fonts[key] = pygame.font.Font(self.path(name), size)
+        return font
+
+    def clear(self):
+        """ Descarta todo lo cargado, p. ej. para recargar los assets desde otro directorio """
+        self.images.clear()
+        self.masks.clear()
+        self.fonts.clear()
+
+
+# Caché compartido por todo el proceso
+ASSETS = AssetCache()
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Modo espectador: dibuja a toda una generación jugando al mismo tiempo.
+
+Las aves se simulan juntas en un BatchFlappyEngine con tubos compartidos y se dibujan semitransparentes sobre el mismo
+recorrido. El ave que va ganando (la de mayor fitness entre las vivas) se dibuja opaca y con contorno. Solo se dibuja
+uno de cada render_every cuadros, así una generación completa se ve en el tiempo de un episodio.
+
+    spectator = SpectatorGame(render_every=4)
+    evaluator = SequentialEvaluator(spectator.play_networks, batched=True)
+"""
+import pygame
+from pygame.locals import *
+
+from game.batch import BatchFlappyEngine, network_policy, play_batch
+from game.engine import TubesPairState, NO_LIMITS
+from game.render import Renderer
+from game.resources import ASSETS
+
+CHAMPION_COLOR = (255, 215, 0)
+
+
+class SpectatorGame:
+
+    def __init__(self, render_every=4, fps=60, alpha=80):
+        """
+        :param render_every: Se dibuja uno de cada render_every cuadros simulados
+        :param fps: Límite de cuadros dibujados por segundo. 0 dibuja tan rápido como se pueda
+        :param alpha: Opacidad (0 a 255) de las aves que no son el campeón
+        """
+        self.render_every = render_every
+        self.fps = fps
+        self.alpha = alpha
+        self.screen = None
+        self.renderer = None
+        self.clock = None
+        self.bird_image = None
+        self.champion_image = None
+        self.tube_up = None
+        self.tube_down = None
+        self.is_executing = False
+        self.episodes = 0
+
+    def init_display(self):
+        pygame.init()
+        pygame.font.init()
+        self.screen = pygame.display.set_mode((BatchFlappyEngine.WIDTH, BatchFlappyEngine.HEIGHT),
+                                              HWSURFACE | DOUBLEBUF | RESIZABLE)
+        pygame.display.set_caption("Flappy IA - Generación completa")
+        self.renderer = Renderer(self.screen, ASSETS.image('background.png'), ASSETS.font('ARCADECLASSIC.TTF', 30))
+        self.clock = pygame.time.Clock()
+
+        bird = ASSETS.image('flappy.png')
+        self.bird_image = bird.copy()
+        self.bird_image.set_alpha(self.alpha)
+        # El campeón se dibuja opaco con el contorno de su máscara, en una superficie 2 pixeles más grande por lado
+        self.champion_image = pygame.Surface((bird.get_width() + 4, bird.get_height() + 4), SRCALPHA)
+        self.champion_image.blit(bird, (2, 2))
+        outline = [(x + 2, y + 2) for x, y in ASSETS.mask('flappy.png').outline()]
+        if len(outline) > 1:
+            pygame.draw.lines(self.champion_image, CHAMPION_COLOR, True, outline, 2)
+        self.tube_up = ASSETS.image('tube_up.png')
+        self.tube_down = ASSETS.image('tube_down.png')
+        self.is_executing = True
+
+    def handle_events(self):
+        for events in pygame.event.get():
+            if events.type == QUIT:
+                self.close()
+                return
+            elif events.type == VIDEORESIZE:
+                self.renderer.resize(events.size)
+
+    def close(self):
+        """ Cierra la ventana. Los episodios siguientes se simulan sin dibujar """
+        self.is_executing = False
+        pygame.display.quit()
+
+    @staticmethod
+    def champion(engine):
+        """ Índice del ave viva con mayor fitness, o None si no quedan aves vivas """
+        if not engine.alive.any():
+            return None
+        fitness = engine.get_fitness()
+        fitness[~engine.alive] = -float('inf')
+        return int(fitness.argmax())
+
+    def draw(self, engine):
+        """ Dibuja el estado actual de engine (BatchFlappyEngine con tubos compartidos) y lo muestra """
+        renderer = self.renderer
+        renderer.begin()
+        gap = TubesPairState.HALF_GAP
+        for left, center in zip(engine.tubes_left, engine.tubes_center[0]):
+            renderer.blit(self.tube_up, (left, center + gap))
+            renderer.blit(self.tube_down, (left, center - gap - TubesPairState.HEIGHT))
+
+        champion = self.champion(engine)
+        x = engine.bird_x - self.bird_image.get_width() / 2
+        half_height = self.bird_image.get_height() / 2
+        for i in engine.alive.nonzero()[0]:
+            if i != champion:
+                renderer.blit(self.bird_image, (x, engine.bird_y[i] - half_height))
+        if champion is not None:
+            renderer.blit(self.champion_image, (x - 2, engine.bird_y[champion] - half_height - 2))
+
+        text = 'Episodio  {}   Vivas  {} de {}   Score  {}'.format(self.episodes, int(engine.alive.sum()),
+                                                                   engine.n_birds, int(engine.score.max()))
+        renderer.blit(renderer.text(text, (255, 255, 255)), (10, 10))
+        renderer.present()
+
+    def on_tick(self, engine):
+        """ Hook de play_batch: atiende la ventana y dibuja uno de cada render_every cuadros """
+        if not self.is_executing or engine.ticks % self.render_every:
+            return
+        self.handle_events()
+        if self.is_executing:
+            self.draw(engine)
+            if self.fps:
+                self.clock.tick(self.fps)
+
+    def play_networks(self, population_network, seed=None, limits=NO_LIMITS, deadline=None, recorder=None):
+        """
+        Como game.batch.play_networks, pero dibujando a todas las aves. Se usa como play_function de ia.evaluation
+        con batched=True. La ventana se abre en la primera llamada
+        """
+        if self.screen is None:
+            self.init_display()
+        self.episodes += 1
+        if self.is_executing:
+            self.renderer.invalidate()
+        return play_batch(network_policy(population_network), len(population_network), seed=seed, limits=limits,
+                          deadline=deadline, on_tick=self.on_tick, recorder=recorder)
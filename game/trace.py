@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+Historial de episodios cuadro a cuadro en formato columnar de solo agregado.
+
+Un trace es un directorio con un archivo binario por columna (COLUMNS) y un trace.json con el tipo de cada una. Cada
+cuadro agrega un valor al final de cada columna, así que escribir es barato y se puede seguir agregando en otra
+sesión. TraceReader abre las columnas con numpy.memmap, de modo que se pueden analizar millones de cuadros sin
+cargarlos en memoria.
+
+El registro de un cuadro describe el estado antes de aplicar la acción: episodio, número de cuadro, altura del ave,
+velocidad vertical (pixeles por milisegundo respecto al cuadro anterior), las 3 distancias de get_distances, la
+acción tomada y el puntaje.
+
+TraceWriter graba tanto un FlappyEngine (el juego con ventana, replay.py) como un BatchFlappyEngine (la evolución con
+game.batch.play_batch). En un lote cada ave es un episodio propio, y sus cuadros quedan juntos como los de cualquier
+otro episodio.
+"""
+import json
+import os
+
+import numpy as np
+
+from game.engine import FRAME_TIME
+
+VERSION = 1
+META_FILE = 'trace.json'
+COLUMNS = (('episode', '<u4'),
+           ('tick', '<u4'),
+           ('bird_y', '<f4'),
+           ('velocity', '<f4'),
+           ('distance_ground', '<f4'),
+           ('distance_up', '<f4'),
+           ('distance_down', '<f4'),
+           ('action', 'u1'),
+           ('score', '<u4'))
+
+
+def column_path(path, name):
+    return os.path.join(path, name + '.bin')
+
+
+class TraceWriter:
+    """
+    Escribe cuadros en el trace del directorio path, creándolo si no existe. Los cuadros se acumulan en memoria y se
+    escriben cada buffer_size cuadros con una sola escritura por columna.
+    Sirve como recorder de FlappyGame (record_frame) y de game.batch.play_batch (record_batch).
+    """
+
+    def __init__(self, path, buffer_size=8192):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, META_FILE)
+        if os.path.exists(meta_path):
+            check_meta(path)
+        else:
+            with open(meta_path, 'w') as f:
+                json.dump({'version': VERSION, 'columns': [list(column) for column in COLUMNS]}, f)
+
+        # Los episodios nuevos continúan la numeración de los ya guardados
+        existing = TraceReader(path)
+        length = len(existing)
+        self.episode = int(existing['episode'][-1]) + 1 if length else 0
+        del existing
+        # Se descartan los cuadros de una escritura que quedó a medias para que las columnas sigan alineadas
+        for name, dtype in COLUMNS:
+            filename = column_path(path, name)
+            if os.path.exists(filename):
+                os.truncate(filename, length * np.dtype(dtype).itemsize)
+
+        self.buffers = {name: np.empty(buffer_size, dtype=dtype) for name, dtype in COLUMNS}
+        self.files = {name: open(column_path(path, name), 'ab') for name, _ in COLUMNS}
+        self.size = 0
+        self.recorded = 0
+        self.last_tick = None
+        self.last_y = None
+        # Cuadros del lote en curso: (cuadro, vivas, alturas, distancias, saltos, puntajes, milisegundos)
+        self.batch_frames = []
+
+    def record_frame(self, engine, action, time=None):
+        """
+        Agrega el estado actual de engine (FlappyEngine) y la acción que se le aplicará.
+
+        :param time: Milisegundos del cuadro anterior, para calcular la velocidad. Por defecto FRAME_TIME
+        """
+        self.end_batch()
+        if self.last_tick is not None and engine.ticks <= self.last_tick:
+            self.episode += 1
+            self.last_y = None
+        y = engine.bird.centery
+        velocity = 0. if self.last_y is None else (y - self.last_y) / (time or FRAME_TIME)
+        self.last_tick = engine.ticks
+        self.last_y = y
+
+        i = self.size
+        buffers = self.buffers
+        buffers['episode'][i] = self.episode
+        buffers['tick'][i] = engine.ticks
+        buffers['bird_y'][i] = y
+        buffers['velocity'][i] = velocity
+        (buffers['distance_ground'][i], buffers['distance_up'][i],
+         buffers['distance_down'][i]) = engine.get_distances()
+        buffers['action'][i] = int(action)
+        buffers['score'][i] = engine.score
+        self.size += 1
+        self.recorded += 1
+        if self.size == len(buffers['tick']):
+            self.flush()
+
+    def record_batch(self, engine, jump, time=None):
+        """
+        Agrega el estado de las aves vivas de engine (game.batch.BatchFlappyEngine) y sus saltos. Los cuadros del lote
+        se guardan cuando empieza el episodio siguiente o al cerrar, un episodio por ave.
+
+        :param jump: Arreglo de booleanos con el salto de cada ave
+        :param time: Milisegundos del cuadro anterior, para calcular la velocidad. Por defecto FRAME_TIME
+        """
+        if self.batch_frames and engine.ticks <= self.batch_frames[-1][0]:
+            self.end_batch()
+        self.batch_frames.append((engine.ticks, engine.alive.copy(), engine.bird_y.copy(), engine.get_distances(),
+                                  np.asarray(jump, dtype=bool), engine.score.copy(), time or FRAME_TIME))
+
+    def end_batch(self):
+        """ Escribe los cuadros del lote en curso, con las aves una detrás de otra """
+        if not self.batch_frames:
+            return
+        ticks, alive, bird_y, distances, jump, score, time = (np.array(column) for column in zip(*self.batch_frames))
+        self.batch_frames = []
+        velocity = np.zeros_like(bird_y)
+        velocity[1:] = (bird_y[1:] - bird_y[:-1]) / time[1:, np.newaxis]
+
+        # Columnas de forma (aves, cuadros): al filtrar las vivas quedan los cuadros de cada ave seguidos
+        alive = alive.T
+        recorded = alive.any(axis=1)
+        if not recorded.any():
+            return
+        first = self.episode if self.last_tick is None else self.episode + 1
+        episodes = first + np.cumsum(recorded) - 1
+        self.write_columns({'episode': np.repeat(episodes, alive.sum(axis=1)),
+                            'tick': np.broadcast_to(ticks, alive.shape)[alive],
+                            'bird_y': bird_y.T[alive],
+                            'velocity': velocity.T[alive],
+                            'distance_ground': distances[:, :, 0].T[alive],
+                            'distance_up': distances[:, :, 1].T[alive],
+                            'distance_down': distances[:, :, 2].T[alive],
+                            'action': jump.T[alive],
+                            'score': score.T[alive]})
+        # El próximo cuadro de record_frame empieza un episodio nuevo
+        self.episode = int(episodes[-1])
+        self.last_tick = int(ticks[-1])
+        self.last_y = None
+
+    def write_columns(self, columns):
+        """ Agrega varios cuadros de una vez. columns tiene un arreglo del mismo largo por cada columna """
+        self.flush()
+        for name, dtype in COLUMNS:
+            self.files[name].write(np.asarray(columns[name], dtype=dtype).tobytes())
+            self.files[name].flush()
+        self.recorded += len(columns['tick'])
+
+    def flush(self):
+        if not self.size:
+            return
+        for name, f in self.files.items():
+            f.write(self.buffers[name][:self.size].tobytes())
+            f.flush()
+        self.size = 0
+
+    def close(self):
+        self.end_batch()
+        self.flush()
+        for f in self.files.values():
+            f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def check_meta(path):
+    with open(os.path.join(path, META_FILE)) as f:
+        meta = json.load(f)
+    if meta['version'] != VERSION or [tuple(column) for column in meta['columns']] != list(COLUMNS):
+        raise ValueError('El trace {} tiene otro formato (versión {})'.format(path, meta['version']))
+
+
+class TraceReader:
+    """
+    Columnas de un trace mapeadas desde disco. reader['bird_y'] es un arreglo de solo lectura con todos los cuadros.
+    Si una escritura quedó a medias, todas las columnas se cortan al largo de la más corta.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        check_meta(path)
+        self.columns = {}
+        for name, dtype in COLUMNS:
+            filename = column_path(path, name)
+            length = os.path.getsize(filename) // np.dtype(dtype).itemsize if os.path.exists(filename) else 0
+            if length:
+                self.columns[name] = np.memmap(filename, dtype=dtype, mode='r', shape=(length,))
+            else:
+                self.columns[name] = np.empty(0, dtype=dtype)
+        length = min(len(column) for column in self.columns.values())
+        self.columns = {name: column[:length] for name, column in self.columns.items()}
+
+    def __len__(self):
+        return len(self.columns['tick'])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def episode_bounds(self):
+        """ Lista de (inicio, fin) de cada episodio, en cuadros """
+        if not len(self):
+            return []
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(self['episode'])) + 1))
+        ends = np.append(starts[1:], len(self))
+        return list(zip(starts.tolist(), ends.tolist()))
+
+    def episode(self, index):
+        """ Diccionario con las columnas del episodio index (en orden de grabación) """
+        start, end = self.episode_bounds()[index]
+        return {name: column[start:end] for name, column in self.columns.items()}
+
+    def observations(self):
+        """ (observaciones (N, 3), arreglo de booleanos con las acciones de salto), p. ej. para ia.imitation """
+        observations = np.stack([self['distance_ground'], self['distance_up'], self['distance_down']], axis=1)
+        return observations.astype(float), self['action'] > 0
@@ -0,0 +1,50 @@
+import numpy as np
+
+
+class CompiledNetwork:
+    """
+    Matrix form of a NeuralNetwork. Each layer is one weights matrix of shape (ninputs, nneurons), one bias vector
+    and a vectorized activation function, so a forward pass is one matmul per layer instead of one Neuron.guess per
+    neuron.
+    """
+
+    def __init__(self, weights, biases, activations):
+        """
+        :param weights: List of matrices of shape (ninputs, nneurons), one per layer (InputLayer excluded)
+        :param biases: List of vectors of size nneurons
+        :param activations: List of activation functions that accept numpy arrays
+        """
+        assert len(weights) == len(biases) == len(activations)
+        self.weights = weights
+        self.biases = biases
+        self.activations = activations
+
+    @classmethod
+    def from_layers(cls, layers):
+        """ Builds the matrices from NeuronLayer objects (InputLayer excluded) """
+        weights = [np.array(layer.get_weights_matrix(), dtype=float) for layer in layers]
+        biases = [layer.get_bias_vector() for layer in layers]
+        activations = [layer.neurons[0].activation_function for layer in layers]
+        return cls(weights, biases, activations)
+
+    def feed_forward(self, inputs):
+        """
+        :param inputs: Vector of size ninputs or a matrix with one input per row
+        :return: Numpy array with the outputs of the last layer
+        """
+        out = np.asarray(inputs, dtype=float)
+        for weights, bias, activation in zip(self.weights, self.biases, self.activations):
+            out = activation(out @ weights + bias)
+        return out
+
+    def compile(self):
+        return self
+
+    @property
+    def layers_conf(self):
+        return [self.weights[0].shape[0]] + [bias.shape[0] for bias in self.biases]
+
+
+def compiled_network(network):
+    """ CompiledNetwork of a NeuralNetwork or CompiledNetwork, reusing the one a NeuralNetwork keeps up to date """
+    return getattr(network, 'compiled', None) or network.compile()
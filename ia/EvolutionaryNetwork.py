@@ -1,9 +1,11 @@
 from ia.genetic_algorithm import IOrganism, GeneticAlg
 from ia.NeuralNetwork import NeuralNetwork, Sigmoid
+from ia import Genome
 
 import random
 from datetime import datetime
 from copy import copy
+import numpy as np
 from numpy import argsort
 
 random.seed(datetime.now().second)
@@ -35,9 +37,28 @@ class NetworkOrganism(IOrganism):
             # Solo algunas neuronas mutan
             for idx_neuron in range(len(layer.neurons)):
                 if random.random() < 0.1:
+                    # Los padres comparten neuronas con sus hijos, así que se muta una copia
+                    layer.neurons[idx_neuron] = copy(layer.neurons[idx_neuron])
                     layer.neurons[idx_neuron].randomize()
         self.network.set_layers(self.representation)
 
+    def digest(self):
+        return Genome.NetworkGenome.from_network(self.network).digest()
+
+    def genes(self):
+        return Genome.NetworkGenome.from_network(self.network).data
+
+    @classmethod
+    def from_genome(cls, genome):
+        """ Organismo cuya red tiene los pesos y bias de genome (Genome.NetworkGenome), p. ej. al leer un checkpoint """
+        nlayers = len(genome.layers)
+        network = NeuralNetwork.from_parameters([genome.weights(i) for i in range(nlayers)],
+                                                [genome.biases(i) for i in range(nlayers)],
+                                                learning_rate=.1, neuron_type=Sigmoid)
+        organism = cls(representation=network.get_layers())
+        organism.network = network
+        return organism
+
     def breed(self, organism):
         """ Realiza crossover de neuronas para cada capa """
         brood_repr = []
@@ -48,6 +69,8 @@ class NetworkOrganism(IOrganism):
             #brood_repr.append(NetworkOrganism.average_layers(layer1, layer2))
 
         new_network = copy(self.network)
+        # copy comparte la lista de capas con la red del padre, se crea una nueva para no modificarla
+        new_network.layers = list(self.network.layers)
         new_network.set_layers(brood_repr)
         new_organism = NetworkOrganism(representation=brood_repr)
         new_organism.network = new_network
@@ -66,6 +89,9 @@ class NetworkOrganism(IOrganism):
         crossover_point1 = min(crossover_point1, crossover_point2)
         crossover_point2 = max(crossover_point1, crossover_point2)
         new_layer = copy(layer1)
+        # copy comparte la lista de neuronas con layer1, se crea una nueva para no modificar al padre
+        new_layer.neurons = list(layer1.neurons)
+        new_layer.outputs = list(layer1.outputs)
         new_layer.neurons[crossover_point1:crossover_point2] = layer2.neurons[crossover_point1:crossover_point2]
         return new_layer
 
@@ -80,6 +106,51 @@ class NetworkOrganism(IOrganism):
 
 
 
+class GenomeNetworkOrganism(IOrganism):
+    """
+    Igual que NetworkOrganism, pero su representación es un Genome.NetworkGenome: todos los pesos y bias en un solo
+    arreglo. La red es un CompiledNetwork cuyas matrices son vistas del genoma, así que cruzar y mutar no crea
+    objetos Neuron y la red siempre refleja el genoma.
+    """
+    LAYERS_CONF = [3, 8, 8, 8, 1]
+
+    def __init__(self, *args, **kwargs):
+        self.network = None
+        super().__init__(*args, **kwargs)
+        self.network = self.representation.compile()
+
+    def spontaneous_generation(self, size):
+        self.representation = Genome.NetworkGenome(self.LAYERS_CONF)
+
+    def mutate(self, *args, **kwargs):
+        """ Realiza mutaciones aleatorias de neuronas en cada capa """
+        self.representation.mutate()
+
+    def digest(self):
+        return self.representation.digest()
+
+    def genes(self):
+        return self.representation.data
+
+    @classmethod
+    def from_genome(cls, genome):
+        return cls(representation=genome.copy())
+
+    def breed(self, organism):
+        """ Realiza crossover de neuronas para cada capa """
+        return self.breed_many([self], [organism], [False])[0]
+
+    @classmethod
+    def breed_many(cls, parents1, parents2, mutate):
+        """ Cruza y muta todos los hijos con operaciones sobre una sola matriz de genomas """
+        layers_conf = parents1[0].representation.layers_conf
+        genomes = Genome.crossover(layers_conf,
+                                   np.stack([parent.representation.data for parent in parents1]),
+                                   np.stack([parent.representation.data for parent in parents2]))
+        Genome.mutate(layers_conf, genomes, np.asarray(mutate, dtype=bool))
+        return [cls(representation=Genome.NetworkGenome(layers_conf, data)) for data in genomes]
+
+
 def network_fitness(network_organism):
     """
     El fitness del organismo es el score obtenido en el juego el cual es actualizado una vez que ha terminado de jugar.
@@ -0,0 +1,128 @@
+from ia.CompiledNetwork import CompiledNetwork, compiled_network
+from ia.Neuron import sigmoid
+
+import hashlib
+import numpy as np
+
+# Probability of a single neuron being randomized when a genome mutates
+NEURON_MUTATION_RATE = 0.1
+
+
+def random_genes(shape):
+    """ Same distribution as Neuron.random_weights and Neuron.random_bias """
+    return (np.random.random_sample(shape) - 0.5) * 300
+
+
+class NetworkGenome:
+    """
+    All weights and biases of a network stored in one contiguous float array.
+
+    Each layer is stored as a block of shape (nneurons, ninputs + 1): one row per neuron with its weights followed by
+    its bias. Crossover and mutation work on whole rows, so they behave as the NeuronLayer operations in
+    EvolutionaryNetwork, but as array operations over the flat data.
+    """
+
+    def __init__(self, layers_conf, data=None):
+        """
+        :param layers_conf: Neurons per layer, InputLayer included. E.g. [3, 8, 8, 8, 1]
+        :param data: Flat array with the genes. It is used without copying, so it may be a view into a bigger block.
+                     If None random genes are generated
+        """
+        self.layers_conf = list(layers_conf)
+        if data is None:
+            data = random_genes(genome_size(self.layers_conf))
+        assert data.shape == (genome_size(self.layers_conf),)
+        self.data = data
+        self.layers = layer_views(self.layers_conf, self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    @classmethod
+    def from_network(cls, network):
+        """ Copies the weights and biases of a NeuralNetwork or CompiledNetwork """
+        compiled = compiled_network(network)
+        genome = cls(compiled.layers_conf, np.empty(genome_size(compiled.layers_conf)))
+        for rows, weights, bias in zip(genome.layers, compiled.weights, compiled.biases):
+            rows[:, :-1] = weights.T
+            rows[:, -1] = bias
+        return genome
+
+    def weights(self, layer):
+        """ View of shape (ninputs, nneurons) as in NeuronLayer.get_weights_matrix """
+        return self.layers[layer][:, :-1].T
+
+    def biases(self, layer):
+        return self.layers[layer][:, -1]
+
+    def compile(self, activation=sigmoid):
+        """ CompiledNetwork whose matrices are views of this genome, so it always reflects the current genes """
+        nlayers = len(self.layers)
+        return CompiledNetwork([self.weights(i) for i in range(nlayers)],
+                               [self.biases(i) for i in range(nlayers)],
+                               [activation] * nlayers)
+
+    def mutate(self, rate=NEURON_MUTATION_RATE):
+        """ Randomizes in place the neurons (rows) selected with probability rate """
+        for rows in self.layers:
+            selected = np.random.random_sample(len(rows)) < rate
+            rows[selected] = random_genes((np.count_nonzero(selected), rows.shape[1]))
+
+    def digest(self):
+        """ SHA-1 of the layers configuration and genes """
+        sha = hashlib.sha1(np.asarray(self.layers_conf, dtype=np.int64).tobytes())
+        sha.update(np.ascontiguousarray(self.data, dtype=np.float64).tobytes())
+        return sha.hexdigest()
+
+    def copy(self):
+        return NetworkGenome(self.layers_conf, self.data.copy())
+
+
+def genome_size(layers_conf):
+    return sum((ninputs + 1) * nneurons for ninputs, nneurons in zip(layers_conf[:-1], layers_conf[1:]))
+
+
+def layer_views(layers_conf, data):
+    """
+    Splits genes into one view of shape (..., nneurons, ninputs + 1) per layer.
+
+    :param data: Array whose last axis holds the genes of one genome. Leading axes index genomes
+    """
+    views = []
+    offset = 0
+    for ninputs, nneurons in zip(layers_conf[:-1], layers_conf[1:]):
+        size = (ninputs + 1) * nneurons
+        views.append(data[..., offset:offset + size].reshape(data.shape[:-1] + (nneurons, ninputs + 1)))
+        offset += size
+    return views
+
+
+def crossover(layers_conf, parents1, parents2):
+    """
+    Two points crossover of neurons for every layer of many pairs of genomes at once.
+
+    :param parents1: Matrix of shape (nchildren, genome_size)
+    :param parents2: Matrix of the same shape as parents1
+    :return: Matrix with one child genome per row. Neurons between both crossover points come from parents2
+    """
+    children = parents1.copy()
+    for children_rows, parents2_rows in zip(layer_views(layers_conf, children), layer_views(layers_conf, parents2)):
+        nchildren, nneurons = children_rows.shape[:2]
+        points = np.sort((np.random.random_sample((nchildren, 2)) * nneurons).astype(int), axis=1)
+        neurons = np.arange(nneurons)
+        from_parent2 = (points[:, :1] <= neurons) & (neurons < points[:, 1:])
+        children_rows[from_parent2] = parents2_rows[from_parent2]
+    return children
+
+
+def mutate(layers_conf, genomes, mutate_genome, rate=NEURON_MUTATION_RATE):
+    """
+    Randomizes in place neurons of the selected genomes.
+
+    :param genomes: Matrix of shape (ngenomes, genome_size)
+    :param mutate_genome: Boolean array of size ngenomes with the genomes that mutate
+    :param rate: Probability of each neuron of a mutating genome to be randomized
+    """
+    for rows in layer_views(layers_conf, genomes):
+        selected = (np.random.random_sample(rows.shape[:2]) < rate) & mutate_genome[:, np.newaxis]
+        rows[selected] = random_genes((np.count_nonzero(selected), rows.shape[2]))
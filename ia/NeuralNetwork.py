@@ -1,5 +1,6 @@
 from ia.NeuronLayer import NeuronLayer, InputLayer
 from ia.Neuron import Neuron, Perceptron, Sigmoid
+from ia.CompiledNetwork import CompiledNetwork
 
 import numpy as np
 
@@ -10,7 +11,13 @@ def mean_squared_error(y1, y2):
 
 class NeuralNetwork:
 
-    def __init__(self, layers_conf, learning_rate=.1, neuron_type=Neuron):
+    def __init__(self, layers_conf, learning_rate=.1, neuron_type=Neuron, weights=None, biases=None):
+        """
+        :param layers_conf: Neurons per layer, InputLayer included. E.g. [3, 8, 8, 8, 1]
+        :param weights: Optional list with one matrix of shape (ninputs, nneurons) per layer (InputLayer excluded).
+                        If None the weights are random
+        :param biases: Optional list with one bias vector per layer. If None the biases are random
+        """
         self.layers = []
 
         self.layers.append(InputLayer(neurons=layers_conf[0]))
@@ -19,13 +26,45 @@ class NeuralNetwork:
             nneurons = layers_conf[i]
             inputs_next_layer = layers_conf[i - 1]
             self.layers.append(NeuronLayer(ninputs=inputs_next_layer, neurons=nneurons, learning_rate=learning_rate,
-                                           neuron_type=neuron_type))
+                                           neuron_type=neuron_type,
+                                           weights=None if weights is None else np.asarray(weights[i - 1], float),
+                                           biases=None if biases is None else biases[i - 1]))
 
         self.input_layer = self.layers[0]
         self.output_layer = self.layers[-1]
         self.lr = learning_rate
+        self.compiled = None
+        self.compile()
+
+    @classmethod
+    def from_parameters(cls, weights, biases, learning_rate=.1, neuron_type=Neuron):
+        """
+        Network with the given parameters, without generating random ones first.
+
+        :param weights: List with one matrix of shape (ninputs, nneurons) per layer (InputLayer excluded)
+        :param biases: List with one bias vector per layer
+        """
+        layers_conf = [np.shape(weights[0])[0]] + [len(bias) for bias in biases]
+        return cls(layers_conf, learning_rate, neuron_type, weights, biases)
+
+    @property
+    def neuron_type(self):
+        return self.output_layer.get_neuron_class
+
+    def compile(self):
+        """
+        Rebuilds the matrix representation used by feed_forward. It is called whenever the network changes its
+        neurons through this class; call it again after modifying neurons directly.
+        """
+        self.compiled = CompiledNetwork.from_layers(self.get_layers())
+        return self.compiled
 
     def feed_forward(self, inputs):
+        """ Fast forward pass using the compiled matrices. Returns a numpy array with the output layer values """
+        return self.compiled.feed_forward(inputs)
+
+    def feed_forward_neurons(self, inputs):
+        """ Forward pass through every Neuron.guess. Stores each neuron output as required by train """
         out = inputs
         for layer in self.layers:
             out = layer.feed_forward(out)
@@ -33,36 +72,86 @@ class NeuralNetwork:
 
     def train(self, train_values, expected_output):
         # Feed network
-        network_output = self.feed_forward(train_values)
+        network_output = self.feed_forward_neurons(train_values)
 
         # Deltas update
         self.output_layer.update_output_deltas(expected_output=expected_output)
 
         for i in range(len(self.layers) - 2, 0, -1):  # We omit InputLayer
             weights_matrix = self.layers[i + 1].get_weights_matrix()
-            deltas_matrix = self.layers[i + 1].get_deltas_matrix(required=len(self.layers[i].neurons))
-            self.layers[i].update_hidden_deltas(weights=weights_matrix, deltas=deltas_matrix)
+            deltas_vector = self.layers[i + 1].get_deltas_vector()
+            self.layers[i].update_hidden_deltas(weights=weights_matrix, deltas=deltas_vector)
 
         # Weights and bias update
 
         for layer in self.layers[1:]:  # We omit InputLayer
             layer.update_neuron_params()
+        self.compile()
 
         return mean_squared_error(network_output, expected_output)
 
-    def epoch_training(self, dataset, epoch=100):
+    def train_batch(self, train_values, expected_outputs):
+        """
+        One gradient step over a mini-batch, with the forward and backward passes as matrix operations over the
+        whole batch. The step uses the mean gradient of the batch, so a batch of one sample gives the same result as
+        train.
+
+        :param train_values: Matrix with one input per row
+        :param expected_outputs: Matrix with one expected output per row
+        :return: Mean squared error of the batch before the update
+        """
+        inputs = np.atleast_2d(np.asarray(train_values, dtype=float))
+        expected = np.atleast_2d(np.asarray(expected_outputs, dtype=float))
+
+        # Forward pass keeping the outputs of every layer
+        outputs = [inputs]
+        for weights, bias, activation in zip(self.compiled.weights, self.compiled.biases, self.compiled.activations):
+            outputs.append(activation(outputs[-1] @ weights + bias))
+        network_output = outputs[-1]
+
+        # Backward pass. As Neuron.update_delta, deltas use the derivative of the sigmoid
+        deltas = [(expected - network_output) * network_output * (1.0 - network_output)]
+        for weights, layer_output in zip(self.compiled.weights[:0:-1], outputs[-2:0:-1]):
+            deltas.append((deltas[-1] @ weights.T) * layer_output * (1.0 - layer_output))
+        deltas.reverse()
+
+        # Weights and bias update
+        batch_size = len(inputs)
+        for layer, weights, bias, layer_input, delta in zip(self.get_layers(), self.compiled.weights,
+                                                            self.compiled.biases, outputs[:-1], deltas):
+            layer.set_parameters(weights + self.lr * (layer_input.T @ delta) / batch_size,
+                                 bias + self.lr * delta.mean(axis=0))
+        self.compile()
+
+        return np.mean(np.sum((network_output - expected) ** 2, axis=1) / expected.shape[1])
+
+    def epoch_training(self, dataset, epoch=100, batch_size=None, verbose=True):
         """
 
         :param dataset: list of tuples(input, expected values)
         :param epoch: Times to train the network
+        :param batch_size: If None every sample is trained on its own with train. Else the dataset is split in
+                           consecutive mini-batches of this size trained with train_batch
+        :param verbose: Print a line per epoch
         :return: list with epoch errors
         """
+        if batch_size is not None:
+            inputs = np.array([training_input for training_input, _ in dataset], dtype=float)
+            expected = np.array([expected_value for _, expected_value in dataset], dtype=float)
+
         errors = []
         for e in range(epoch):
-            print('Epoch {} de {}. Learning rate {}'.format(e+1, epoch, self.lr))
+            if verbose:
+                print('Epoch {} de {}. Learning rate {}'.format(e+1, epoch, self.lr))
             epoch_error = 0
-            for training_input, expected_value in dataset:
-                epoch_error += self.train(training_input, expected_value)
+            if batch_size is None:
+                for training_input, expected_value in dataset:
+                    epoch_error += self.train(training_input, expected_value)
+            else:
+                for start in range(0, len(dataset), batch_size):
+                    batch_error = self.train_batch(inputs[start:start + batch_size],
+                                                   expected[start:start + batch_size])
+                    epoch_error += batch_error * len(inputs[start:start + batch_size])
             errors.append(epoch_error/len(dataset))
         return errors
 
@@ -74,3 +163,4 @@ class NeuralNetwork:
         """ Set self.layers from layers, excluding InputLayer """
         self.layers[1:] = layers
         self.output_layer = self.layers[-1]
+        self.compile()
@@ -8,6 +8,19 @@ def random_weights(n):
 def random_bias():
     return (np.random.random() - 0.5) * 300
 
+
+def identity(x):
+    return x
+
+
+def step(x):
+    return (np.asarray(x) > 0).astype(int)
+
+
+def sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
 class Neuron:
 
     def __init__(self, ninputs=1, bias=None, weights=None, learning_rate=.1):
@@ -25,7 +38,7 @@ class Neuron:
         else:
             assert len(weights) == ninputs
             self.weights = np.array(weights)
-        self.bias = bias if bias else random_bias()
+        self.bias = bias if bias is not None else random_bias()
         self.ninputs = ninputs
         self.lr = learning_rate
         self.delta = 0
@@ -51,14 +64,9 @@ class Neuron:
         self.output = self.activation_function(weighted_sum)
         return self.output
 
-    def activation_function(self, x):
-        """
-        Función de activación. Por defecto retorna la entrada
-
-        :param x: Ponderación de la entrada y los pesos de la neurona sumado a bias
-        :return: Número
-        """
-        return x
+    # Función de activación. Por defecto retorna la entrada. Debe aceptar números y arreglos de numpy, pues
+    # CompiledNetwork la aplica a una capa completa
+    activation_function = staticmethod(identity)
 
     def update_delta(self, error):
         """
@@ -80,14 +88,12 @@ class Neuron:
 
 class Perceptron(Neuron):
 
-    def activation_function(self, x):
-        return int(x > 0)
+    activation_function = staticmethod(step)
 
 
 class Sigmoid(Neuron):
 
-    def activation_function(self, x):
-        return 1.0 / (1.0 + np.exp(-x))
+    activation_function = staticmethod(sigmoid)
 
 
 class InputNeuron(Neuron):
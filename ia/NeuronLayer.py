@@ -5,14 +5,20 @@ import numpy as np
 
 class NeuronLayer:
 
-    def __init__(self, ninputs, neurons, learning_rate=.1, neuron_type=Neuron):
+    def __init__(self, ninputs, neurons, learning_rate=.1, neuron_type=Neuron, weights=None, biases=None):
         """
 
         :param ninputs:
         :param neurons:
         :param neuron_type:
+        :param weights: Optional matrix of shape (ninputs, neurons) as returned by get_weights_matrix. If None the
+                        weights are random
+        :param biases: Optional vector of size neurons. If None the biases are random
         """
-        self.neurons = [neuron_type(ninputs=ninputs, learning_rate=learning_rate) for _ in range(neurons)]
+        self.neurons = [neuron_type(ninputs=ninputs, learning_rate=learning_rate,
+                                    weights=None if weights is None else weights[:, i],
+                                    bias=None if biases is None else float(biases[i]))
+                        for i in range(neurons)]
         self.outputs = [0 for _ in range(neurons)]
 
     def feed_forward(self, inputs):
@@ -26,8 +32,12 @@ class NeuronLayer:
             self.neurons[i].update_delta(error=error)
 
     def update_hidden_deltas(self, weights, deltas):
+        """
+        :param weights: Weights matrix of the next layer, shape (len(self), nneurons of the next layer)
+        :param deltas: Deltas vector of the next layer
+        """
         for i in range(len(self.neurons)):
-            error = np.sum(weights[i] * deltas[i])
+            error = np.dot(weights[i], deltas)
             self.neurons[i].update_delta(error=error)
 
     def get_weights_matrix(self):
@@ -37,13 +47,20 @@ class NeuronLayer:
 
         return np.array(weights_matrix).T
 
-    def get_deltas_matrix(self, required):
-        deltas_matrix = []
-        for neuron in self.neurons:
-            deltas_matrix.append([neuron.delta])
-        deltas_matrix *= required
+    def get_bias_vector(self):
+        return np.array([neuron.bias for neuron in self.neurons], dtype=float)
 
-        return np.array(deltas_matrix)
+    def get_deltas_vector(self):
+        return np.array([neuron.delta for neuron in self.neurons], dtype=float)
+
+    def set_parameters(self, weights, biases):
+        """
+        :param weights: Matrix of shape (ninputs, nneurons) as returned by get_weights_matrix
+        :param biases: Vector of size nneurons
+        """
+        for i, neuron in enumerate(self.neurons):
+            neuron.weights = np.array(weights[:, i], dtype=float)
+            neuron.bias = float(biases[i])
 
     def update_neuron_params(self):
         for neuron in self.neurons:
@@ -0,0 +1,68 @@
+import numpy as np
+
+from ia.CompiledNetwork import compiled_network
+
+
+class PopulationNetwork:
+    """
+    Stacks the compiled layers of many networks with the same layers_conf into 3-D tensors, so the outputs of a whole
+    population are computed with one matmul per layer.
+    """
+
+    def __init__(self, weights, biases, activations):
+        """
+        :param weights: List of tensors of shape (nnetworks, ninputs, nneurons), one per layer
+        :param biases: List of matrices of shape (nnetworks, nneurons)
+        :param activations: List of vectorized activation functions shared by every network
+        """
+        assert len(weights) == len(biases) == len(activations)
+        self.weights = weights
+        self.biases = biases
+        self.activations = activations
+
+    @classmethod
+    def from_networks(cls, networks):
+        """
+        :param networks: List of NeuralNetwork or CompiledNetwork objects with the same layers_conf and neuron types
+        """
+        compiled = [compiled_network(network) for network in networks]
+        nlayers = len(compiled[0].weights)
+        activations = [getattr(a, '__func__', a) for a in compiled[0].activations]
+        for network in compiled:
+            assert len(network.weights) == nlayers
+            assert [getattr(a, '__func__', a) for a in network.activations] == activations, \
+                'Networks use different neuron types'
+
+        weights = [np.stack([network.weights[i] for network in compiled]) for i in range(nlayers)]
+        biases = [np.stack([network.biases[i] for network in compiled]) for i in range(nlayers)]
+        return cls(weights, biases, list(compiled[0].activations))
+
+    def __len__(self):
+        return self.weights[0].shape[0]
+
+    def feed_forward(self, inputs):
+        """
+        Evaluates each network on its own input.
+
+        :param inputs: Matrix of shape (nnetworks, ninputs). Row i is fed to network i
+        :return: Matrix of shape (nnetworks, noutputs)
+        """
+        out = np.asarray(inputs, dtype=float)
+        for weights, bias, activation in zip(self.weights, self.biases, self.activations):
+            out = activation(np.einsum('pi,pio->po', out, weights) + bias)
+        return out
+
+    def feed_forward_batch(self, inputs):
+        """
+        Evaluates every network on a batch of inputs.
+
+        :param inputs: Matrix of shape (batch, ninputs) shared by all networks, or tensor of shape
+                       (nnetworks, batch, ninputs) with one batch per network
+        :return: Tensor of shape (nnetworks, batch, noutputs)
+        """
+        out = np.asarray(inputs, dtype=float)
+        if out.ndim == 2:
+            out = out[np.newaxis]
+        for weights, bias, activation in zip(self.weights, self.biases, self.activations):
+            out = activation(out @ weights + bias[:, np.newaxis, :])
+        return out
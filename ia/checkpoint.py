@@ -0,0 +1,124 @@
+"""
+Snapshots of a GeneticAlg run in a single uncompressed .npz file.
+
+A checkpoint holds the population as one packed gene matrix (see ia.Genome), the fitness of each of its organisms (NaN
+for the offspring not evaluated yet, see GeneticAlg.population_fitness), the generation counter and the state of every
+random generator the GA uses, so a resumed run continues exactly as the original one would have. The fitness function,
+selection function and evaluator are code, not state: resume into a GeneticAlg built with the same arguments.
+"""
+import os
+import random as pyrandom
+import warnings
+
+import numpy as np
+
+from ia.Genome import NetworkGenome
+from ia.evaluation import population_genes
+
+FORMAT_VERSION = 1
+
+
+def python_rng_state():
+    version, internal, gauss = pyrandom.getstate()
+    return {'python_rng_version': np.int64(version),
+            'python_rng_internal': np.array(internal, dtype=np.int64),
+            'python_rng_gauss': np.array([np.nan if gauss is None else gauss])}
+
+
+def set_python_rng_state(snapshot):
+    gauss = float(snapshot['python_rng_gauss'][0])
+    pyrandom.setstate((int(snapshot['python_rng_version']),
+                       tuple(int(value) for value in snapshot['python_rng_internal']),
+                       None if np.isnan(gauss) else gauss))
+
+
+def numpy_rng_state(prefix, state):
+    """ State of a np.random.RandomState as arrays. state is the tuple returned by get_state() """
+    name, keys, pos, has_gauss, cached_gaussian = state
+    assert name == 'MT19937'
+    return {prefix + '_keys': np.asarray(keys, dtype=np.uint32),
+            prefix + '_params': np.array([pos, has_gauss]),
+            prefix + '_gauss': np.array([cached_gaussian])}
+
+
+def set_numpy_rng_state(snapshot, prefix, rng):
+    pos, has_gauss = snapshot[prefix + '_params']
+    rng.set_state(('MT19937', snapshot[prefix + '_keys'], int(pos), int(has_gauss),
+                   float(snapshot[prefix + '_gauss'][0])))
+
+
+def save_checkpoint(genetic_alg, path):
+    """
+    Writes the state of genetic_alg to path. The file is written next to path and then renamed, so a crash while
+    saving never leaves a truncated checkpoint behind.
+    """
+    layers_conf, genes = population_genes(genetic_alg.population)
+    arrays = {'version': np.int64(FORMAT_VERSION),
+              'layers_conf': np.asarray(layers_conf, dtype=np.int64),
+              'genes': genes,
+              'fitness': np.asarray(genetic_alg.population_fitness, dtype=float),
+              'truncated': np.asarray(genetic_alg.population_truncated, dtype=bool),
+              'generation': np.int64(genetic_alg.generation),
+              'episode_seeds': np.asarray(genetic_alg.episode_seeds, dtype=np.int64)}
+    arrays.update(python_rng_state())
+    arrays.update(numpy_rng_state('numpy_rng', np.random.get_state()))
+    arrays.update(numpy_rng_state('episode_rng', genetic_alg.episode_rng.get_state()))
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path):
+    """ Dictionary with the arrays of a checkpoint """
+    with np.load(path) as snapshot:
+        arrays = {name: snapshot[name] for name in snapshot.files}
+    if int(arrays['version']) != FORMAT_VERSION:
+        raise ValueError('Unsupported checkpoint version {} in {}'.format(int(arrays['version']), path))
+    return arrays
+
+
+def restore_checkpoint(genetic_alg, path):
+    """
+    Replaces the population, fitness, generation counter and random generator states of genetic_alg with the ones
+    saved in path. genetic_alg.organism_type must implement the classmethod from_genome(NetworkGenome).
+    The fitness cache is not part of the checkpoint and starts empty. If genetic_alg plays another number of episodes
+    per organism than the saved run, new episode seeds are drawn.
+
+    :return: genetic_alg
+    """
+    snapshot = load_checkpoint(path)
+    layers_conf = snapshot['layers_conf'].tolist()
+    population = [genetic_alg.organism_type.from_genome(NetworkGenome(layers_conf, row.copy()))
+                  for row in snapshot['genes']]
+
+    genetic_alg.population = np.array(population)
+    genetic_alg.population_size = len(population)
+    genetic_alg.fitness = genetic_alg.population_fitness = snapshot['fitness']
+    genetic_alg.truncated = genetic_alg.population_truncated = snapshot['truncated']
+    genetic_alg.generation = int(snapshot['generation'])
+    genetic_alg.episode_seeds = tuple(int(seed) for seed in snapshot['episode_seeds'])
+
+    # Building the organisms consumes random numbers, so the generators are restored last
+    set_python_rng_state(snapshot)
+    set_numpy_rng_state(snapshot, 'numpy_rng', np.random)
+    set_numpy_rng_state(snapshot, 'episode_rng', genetic_alg.episode_rng)
+    if len(genetic_alg.episode_seeds) != genetic_alg.episodes:
+        # The run was saved with another number of episodes per organism
+        warnings.warn('Checkpoint {} has {} episode seeds, drawing {} new ones'.format(
+            path, len(genetic_alg.episode_seeds), genetic_alg.episodes))
+        genetic_alg.episode_seeds = genetic_alg.new_episode_seeds()
+    return genetic_alg
+
+
+class Checkpointer:
+    """ Callable for GeneticAlg.evolve that saves a checkpoint every 'every' generations """
+
+    def __init__(self, path, every=1):
+        self.path = path
+        self.every = every
+
+    def __call__(self, genetic_alg):
+        if genetic_alg.generation % self.every == 0:
+            save_checkpoint(genetic_alg, self.path)
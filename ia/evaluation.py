@@ -0,0 +1,164 @@
+"""
+Evaluators compute the fitness of a whole population for GeneticAlg. Organisms are converted to compact gene arrays
+(see ia.Genome) before being evaluated, so they can be shipped to worker processes without pickling Neuron objects.
+"""
+import multiprocessing as mp
+import time
+
+import numpy as np
+
+from ia.Genome import NetworkGenome
+from ia.Neuron import sigmoid
+from ia.PopulationNetwork import PopulationNetwork
+
+
+def organism_genes(organism):
+    """ Flat genes of a NetworkOrganism or GenomeNetworkOrganism """
+    if isinstance(organism.representation, NetworkGenome):
+        return organism.representation.data
+    return NetworkGenome.from_network(organism.network).data
+
+
+def population_genes(population):
+    """
+    :return: (layers_conf, matrix with the genes of one organism per row)
+    """
+    layers_conf = organism_layers_conf(population[0])
+    return layers_conf, np.stack([organism_genes(organism) for organism in population])
+
+
+def organism_layers_conf(organism):
+    if isinstance(organism.representation, NetworkGenome):
+        return organism.representation.layers_conf
+    return organism.network.compile().layers_conf
+
+
+class TimedNetwork:
+    """ Wraps a network and accumulates the seconds spent in its feed_forward """
+
+    def __init__(self, network):
+        self.network = network
+        self.seconds = 0.
+
+    def feed_forward(self, inputs):
+        start = time.perf_counter()
+        outputs = self.network.feed_forward(inputs)
+        self.seconds += time.perf_counter() - start
+        return outputs
+
+    def __len__(self):
+        return len(self.network)
+
+
+def evaluate_genes(play_function, layers_conf, genes, batched=False, activation=sigmoid, seed=None, deadline=None):
+    """
+    Builds the networks described by genes and plays them.
+
+    :param play_function: If batched is False, play_function(network, seed) returns the fitness of one network. Else
+                          play_function(population_network, seed) returns an array with the fitness of every network.
+                          It may also return an object with 'fitness', 'truncated' and 'ticks' fields, such as
+                          game.engine.EpisodeResult
+    :param genes: Matrix with the genes of one network per row
+    :param seed: Episode seed passed to play_function. The same seed gives every network the same episode
+    :param deadline: If not None it is passed to play_function, which should cut its episodes at that time.time()
+    :return: (array with one fitness per row of genes, dictionary with the 'truncated' episodes, the 'ticks' played
+             by each network and the 'inference_seconds' spent in feed_forward)
+    """
+    kwargs = {'seed': seed} if deadline is None else {'seed': seed, 'deadline': deadline}
+    networks = [NetworkGenome(layers_conf, row).compile(activation) for row in genes]
+    if batched:
+        timed = [TimedNetwork(PopulationNetwork.from_networks(networks))]
+        results = play_function(timed[0], **kwargs)
+        fitness = np.asarray(getattr(results, 'fitness', results), dtype=float)
+        truncated = np.asarray(getattr(results, 'truncated', np.zeros(len(genes), dtype=bool)), dtype=bool)
+        ticks = np.asarray(getattr(results, 'ticks', np.zeros(len(genes), dtype=int)), dtype=int)
+    else:
+        timed = [TimedNetwork(network) for network in networks]
+        results = [play_function(network, **kwargs) for network in timed]
+        fitness = np.array([getattr(result, 'fitness', result) for result in results], dtype=float)
+        truncated = np.array([getattr(result, 'truncated', False) for result in results], dtype=bool)
+        ticks = np.array([getattr(result, 'ticks', 0) for result in results], dtype=int)
+    return fitness, {'truncated': truncated, 'ticks': ticks,
+                     'inference_seconds': sum(network.seconds for network in timed)}
+
+
+def _evaluate_chunk(args):
+    return evaluate_genes(*args)
+
+
+class SequentialEvaluator:
+    """ Evaluates the population in the current process """
+
+    def __init__(self, play_function, batched=False, activation=sigmoid):
+        """
+        :param play_function: See evaluate_genes
+        :param batched: See evaluate_genes
+        :param activation: Activation function of every layer of the evaluated networks
+        """
+        self.play_function = play_function
+        self.batched = batched
+        self.activation = activation
+        # Statistics of the last call: episodes cut by a limit instead of ending by themselves, ticks played by each
+        # organism and seconds spent in feed_forward (summed over all workers)
+        self.truncated = None
+        self.ticks = None
+        self.inference_seconds = 0.
+
+    def __call__(self, population, seed=None, deadline=None):
+        """
+        :param deadline: time.time() at which the episodes still being played are truncated
+        :return: Array with the fitness of each organism. Truncated episodes are flagged in self.truncated
+        """
+        layers_conf, genes = population_genes(population)
+        fitness, info = evaluate_genes(self.play_function, layers_conf, genes, self.batched, self.activation, seed,
+                                       deadline)
+        self.set_info([info])
+        return fitness
+
+    def set_info(self, infos):
+        """ Merges the statistics of the evaluated chunks """
+        self.truncated = np.concatenate([info['truncated'] for info in infos])
+        self.ticks = np.concatenate([info['ticks'] for info in infos])
+        self.inference_seconds = sum(info['inference_seconds'] for info in infos)
+
+
+class PoolEvaluator(SequentialEvaluator):
+    """
+    Evaluates the population in a multiprocessing pool. The population is split in chunks and each worker receives
+    only the gene matrix of its chunk.
+    play_function must be picklable (defined at module level).
+    """
+
+    def __init__(self, play_function, batched=False, activation=sigmoid, processes=None, chunksize=None):
+        """
+        :param processes: Number of worker processes. Defaults to the number of CPUs
+        :param chunksize: Organisms per task. Defaults to an even split of the population among the workers
+        """
+        super().__init__(play_function, batched, activation)
+        self.processes = processes or mp.cpu_count()
+        self.chunksize = chunksize
+        self.pool = None
+
+    def __call__(self, population, seed=None, deadline=None):
+        if self.pool is None:
+            self.pool = mp.Pool(self.processes)
+
+        layers_conf, genes = population_genes(population)
+        chunksize = self.chunksize or max(1, int(np.ceil(len(genes) / self.processes)))
+        tasks = [(self.play_function, layers_conf, genes[i:i + chunksize], self.batched, self.activation, seed,
+                  deadline) for i in range(0, len(genes), chunksize)]
+        fitness, infos = zip(*self.pool.map(_evaluate_chunk, tasks))
+        self.set_info(infos)
+        return np.concatenate(fitness)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -1,5 +1,7 @@
 import numpy as np
 import random as pyrandom
+import time
+from collections import OrderedDict
 from datetime import datetime
 
 pyrandom.seed(datetime.now().second)
@@ -11,6 +13,7 @@ class IOrganism:
     - spontaneous_generation(size): Useful when initializing a new population
     - mutate(*args, **kwargs)
     - breed(organism)
+    Subclasses may override the classmethod breed_many to create a whole offspring at once
     """
 
     def __init__(self, representation=None, size=0, auto_generate_repr=True):
@@ -51,6 +54,33 @@ class IOrganism:
         """
         pass
 
+    @classmethod
+    def breed_many(cls, parents1, parents2, mutate):
+        """
+        Breeds parents1[i] with parents2[i] for every i and mutates the children selected by mutate.
+        Return a list of new organisms
+        """
+        offsprings = []
+        for parent1, parent2, mutate_child in zip(parents1, parents2, mutate):
+            offsprings.append(parent1.breed(parent2))
+            if mutate_child:
+                offsprings[-1].mutate()
+        return offsprings
+
+    def digest(self):
+        """
+        Hashable identifier of the genome, used to cache fitness. Organisms with equal digests must play
+        identically. Return None (default) to disable caching for this organism
+        """
+        return None
+
+    def genes(self):
+        """
+        Flat numeric array with the genome, used to measure the diversity of the population. Return None (default)
+        if the genome has no numeric form
+        """
+        return None
+
     def set_fitness(self, f):
         self._fitness = f
 
@@ -60,6 +90,102 @@ class IOrganism:
     fitness = property(get_fitness, set_fitness)
 
 
+class FitnessCache:
+    """ Bounded LRU mapping of (genome digest, episode seeds) to fitness, with hit and miss counters """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """ Returns the cached fitness or None. Organisms without key are not counted """
+        if key is None:
+            return None
+        if key not in self.entries:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def put(self, key, fitness):
+        if key is None or self.max_size <= 0:
+            return
+        self.entries[key] = fitness
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def info(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self), 'max_size': self.max_size}
+
+
+def aggregate_episodes(scores, aggregate='mean'):
+    """
+    Fitness of every organism from its episode scores.
+
+    :param scores: Matrix with one row per organism and one column per episode. NaN marks episodes not played
+    :param aggregate: 'mean', 'min' or a quantile between 0 and 1 (e.g. .25 rewards organisms that rarely fail)
+    """
+    if aggregate == 'mean':
+        return np.nanmean(scores, axis=1)
+    if aggregate == 'min':
+        return np.nanmin(scores, axis=1)
+    return np.nanquantile(scores, aggregate, axis=1)
+
+
+def demote_stopped(fitness, stopped):
+    """
+    Shifts the fitness of early stopped organisms so that they rank below every fully evaluated one, keeping their
+    order among themselves. Aggregated over fewer episodes, a min or low quantile would otherwise favour them.
+
+    :param fitness: Array from aggregate_episodes, modified in place
+    :param stopped: Boolean array with the early stopped organisms
+    """
+    if not stopped.any() or stopped.all():
+        return fitness
+    lowest_kept = fitness[~stopped].min()
+    excess = fitness[stopped].max() - lowest_kept
+    if excess >= 0:
+        fitness[stopped] -= excess + max(1., abs(lowest_kept)) * 1e-6
+    return fitness
+
+
+class EarlyStopping:
+    """
+    Racing rule for multi-episode evaluation. After min_episodes episodes an organism stops being evaluated when the
+    upper bound of its mean score, mean + z * standard error, is below the lower bound of at least a keep_fraction of
+    the population. Its fitness is then aggregated from the episodes it played and ranked below the organisms that
+    played all of them (see demote_stopped)
+    """
+
+    def __init__(self, min_episodes=2, keep_fraction=.5, z=2.):
+        assert min_episodes >= 2, 'The standard error needs at least two episodes'
+        self.min_episodes = min_episodes
+        self.keep_fraction = keep_fraction
+        self.z = z
+
+    def __call__(self, scores, active):
+        """
+        :param scores: Matrix of episode scores played so far (see aggregate_episodes)
+        :param active: Boolean array with the organisms still being evaluated
+        :return: Boolean array with the active organisms to stop evaluating
+        """
+        if scores.shape[1] < self.min_episodes:
+            return np.zeros(len(scores), dtype=bool)
+        played = np.count_nonzero(~np.isnan(scores), axis=1)
+        mean = np.nanmean(scores, axis=1)
+        error = self.z * np.nanstd(scores, axis=1, ddof=1) / np.sqrt(played)
+        keep = max(1, int(np.ceil(self.keep_fraction * len(scores))))
+        reference = np.sort(mean - error)[-keep]
+        return active & (mean + error < reference)
+
+
 class GeneticAlg:
     def __init__(self,
                  pop_size,
@@ -67,7 +193,17 @@ class GeneticAlg:
                  fitness_function,
                  selection_function,
                  mutation_rate=.1,
-                 organism_kwargs={}):
+                 organism_kwargs={},
+                 evaluator=None,
+                 seed=None,
+                 reseed_episodes=True,
+                 cache_size=0,
+                 generation_time_budget=None,
+                 callbacks=None,
+                 initial_population=None,
+                 episodes=1,
+                 aggregate='mean',
+                 early_stopping=None):
         """
 
         :param pop_size: Size of the population
@@ -77,41 +213,226 @@ class GeneticAlg:
                                    Signature sf(organisms, fitnesses, return_best)
         :param organism_kwargs: Extra keyword arguments for organism_type. Implementation dependant
         :param mutation_rate: float
+        :param evaluator: Optional callable evaluator(population, seed[, deadline]) that returns an array with the
+                          fitness of each organism (see ia.evaluation). If given it is used instead of
+                          fitness_function. It may flag truncated episodes in an attribute 'truncated'
+        :param seed: Seeds the random generators used to create, breed and mutate organisms and the generator of
+                     episode seeds, so a run can be reproduced
+        :param reseed_episodes: If True every generation is evaluated with new episode seeds. Else all generations
+                                use the same ones
+        :param cache_size: Maximum entries of the fitness cache. Organisms whose digest and episode seeds are cached
+                           (e.g. elite survivors when reseed_episodes is False, or duplicated offspring) are not
+                           evaluated again. 0 disables the cache
+        :param generation_time_budget: Seconds that the evaluation of a generation may take. The evaluator receives
+                                       the resulting deadline and truncates the episodes still running at that time.
+                                       With fitness_function, organisms not evaluated in time get fitness 0. Either
+                                       way they are flagged in self.truncated and their fitness is not cached
+        :param callbacks: Functions callback(genetic_alg, metrics) called after every generation with the
+                          dictionary returned by generation_metrics (see ia.telemetry)
+        :param initial_population: Optional list of organisms for the first generation, e.g. from
+                                   ia.imitation.warm_start_organisms. The rest of the population is random
+        :param episodes: Seeded episodes played by every organism per generation. Each episode is evaluated for the
+                         whole population at once, so batched evaluators stay batched
+        :param aggregate: How the episode scores become the fitness, see aggregate_episodes
+        :param early_stopping: Optional callable such as EarlyStopping that, between episodes, selects organisms
+                               that are clearly worse than the rest and need not play the remaining episodes. Their
+                               fitness is ranked below the rest and is not cached
         """
+        assert aggregate in ('mean', 'min') or 0 <= aggregate <= 1, 'aggregate must be mean, min or a quantile'
+        self.episodes = episodes
+        self.aggregate = aggregate
+        self.early_stopping = early_stopping
+        if seed is not None:
+            pyrandom.seed(seed)
+            np.random.seed(seed)
+        self.episode_rng = np.random.RandomState(seed)
+        self.reseed_episodes = reseed_episodes
+        self.episode_seeds = self.new_episode_seeds()
+
         self.population_size = pop_size
+        self.organism_type = organism_type
         # Init population
-        self.population = np.array([organism_type(**organism_kwargs) for _ in range(pop_size)])
+        initial_population = list(initial_population or [])[:pop_size]
+        self.population = np.array(initial_population + [organism_type(**organism_kwargs)
+                                                         for _ in range(pop_size - len(initial_population))])
         self.fitness_function = fitness_function
         self.mut_rate = mutation_rate
         self.selection_function = selection_function
         self.fitness = np.array([0 for _ in range(pop_size)])
+        self.evaluator = evaluator
+        self.cache = FitnessCache(cache_size)
+        self.generation_time_budget = generation_time_budget
+        # Generations evaluated and bred so far
+        self.generation = 0
+        self.callbacks = list(callbacks or [])
+        # Statistics of the last calc_fitness, see generation_metrics
+        self.evaluation_info = {}
+        # Organisms of the last evaluated generation whose episode was cut by a limit instead of ending by a crash
+        self.truncated = np.zeros(pop_size, dtype=bool)
+        # Fitness and truncation aligned with self.population once it is replaced: the elite keeps the values of its
+        # evaluation and the offspring, not evaluated yet, have NaN fitness
+        self.population_fitness = np.full(pop_size, np.nan)
+        self.population_truncated = np.zeros(pop_size, dtype=bool)
+
+    def new_episode_seeds(self):
+        return tuple(int(self.episode_rng.randint(2 ** 31 - 1)) for _ in range(self.episodes))
+
+    def cache_key(self, organism):
+        if self.cache.max_size <= 0:
+            return None
+        digest = organism.digest()
+        return None if digest is None else (digest, self.episode_seeds)
 
     def calc_fitness(self):
-        fitness = []
-        for organism in self.population:
-            organism.fitness = self.fitness_function(organism)
-            fitness.append(organism.fitness)
+        fitness = np.zeros(len(self.population))
+
+        # Only one organism of each uncached genome is evaluated
+        pending = OrderedDict()
+        for i, organism in enumerate(self.population):
+            key = self.cache_key(organism)
+            cached = self.cache.get(key)
+            if cached is not None:
+                fitness[i] = cached
+            else:
+                pending.setdefault(key if key is not None else ('organism', i), []).append(i)
+
+        truncated = np.zeros(len(self.population), dtype=bool)
+        evaluate = [indexes[0] for indexes in pending.values()]
+        self.evaluation_info = {'evaluated': len(evaluate),
+                                'cache_hits': len(self.population) - sum(len(indexes) for indexes in pending.values()),
+                                'episodes_played': 0, 'early_stopped': 0, 'frames': None, 'inference_seconds': None}
+        if evaluate:
+            evaluated, evaluated_truncated, stopped = self.evaluate(self.population[evaluate])
+            for (key, indexes), organism_fitness, organism_truncated, organism_stopped in zip(
+                    pending.items(), evaluated, evaluated_truncated, stopped):
+                fitness[indexes] = organism_fitness
+                truncated[indexes] = organism_truncated
+                # A truncated or early stopped fitness depends on the limits, on timing or on the rest of the
+                # population, not only on the genome
+                if not organism_truncated and not organism_stopped:
+                    self.cache.put(self.cache_key(self.population[indexes[0]]), organism_fitness)
+
+        self.truncated = truncated
+        for organism, organism_fitness in zip(self.population, fitness):
+            organism.fitness = organism_fitness
+        return fitness
+
+    def evaluate(self, organisms):
+        """
+        Fitness of organisms over the episodes of self.episode_seeds, within the generation time budget. Between
+        episodes, early_stopping may drop organisms from the remaining ones.
+
+        :return: (array of fitness, boolean array with the organisms truncated in some episode, boolean array with the
+                 early stopped organisms)
+        """
+        deadline = None
+        if self.generation_time_budget is not None:
+            deadline = time.time() + self.generation_time_budget
+
+        scores = np.full((len(organisms), len(self.episode_seeds)), np.nan)
+        truncated = np.zeros(len(organisms), dtype=bool)
+        active = np.ones(len(organisms), dtype=bool)
+        for episode, seed in enumerate(self.episode_seeds):
+            indexes = np.flatnonzero(active)
+            scores[indexes, episode], episode_truncated = self.evaluate_episode(organisms[indexes], seed, deadline)
+            truncated[indexes] |= episode_truncated
+            self.evaluation_info['episodes_played'] += len(indexes)
+            if self.early_stopping is not None and episode + 1 < len(self.episode_seeds):
+                active &= ~self.early_stopping(scores[:, :episode + 1], active)
+
+        stopped = ~active
+        self.evaluation_info['early_stopped'] += int(np.count_nonzero(stopped))
+        return demote_stopped(aggregate_episodes(scores, self.aggregate), stopped), truncated, stopped
+
+    def evaluate_episode(self, organisms, seed, deadline=None):
+        """
+        Fitness of organisms in the episode of the given seed with the evaluator, or with fitness_function, which
+        does not take seeds.
 
-        return np.array(fitness)
+        :return: (array of fitness, boolean array with the truncated evaluations)
+        """
+        if self.evaluator is not None:
+            if deadline is None:
+                fitness = self.evaluator(organisms, seed=seed)
+            else:
+                fitness = self.evaluator(organisms, seed=seed, deadline=deadline)
+            truncated = getattr(self.evaluator, 'truncated', None)
+            if truncated is None:
+                truncated = np.zeros(len(organisms), dtype=bool)
+            ticks = getattr(self.evaluator, 'ticks', None)
+            if ticks is not None:
+                self.evaluation_info['frames'] = (self.evaluation_info['frames'] or 0) + int(np.sum(ticks))
+            inference_seconds = getattr(self.evaluator, 'inference_seconds', None)
+            if inference_seconds is not None:
+                self.evaluation_info['inference_seconds'] = \
+                    (self.evaluation_info['inference_seconds'] or 0.) + inference_seconds
+            return np.asarray(fitness, dtype=float), truncated
+
+        fitness = np.zeros(len(organisms))
+        truncated = np.zeros(len(organisms), dtype=bool)
+        for i, organism in enumerate(organisms):
+            if deadline is not None and time.time() >= deadline:
+                truncated[i:] = True
+                break
+            fitness[i] = self.fitness_function(organism)
+        return fitness, truncated
+
+    def add_callback(self, callback):
+        self.callbacks.append(callback)
+
+    def generation_metrics(self, evaluation_seconds, breed_seconds):
+        """
+        Flat dictionary describing the generation just evaluated: timings, throughput, fitness distribution and
+        diversity. Values that the evaluator does not report are None
+        """
+        fitness = np.asarray(self.fitness, dtype=float)
+        frames = self.evaluation_info.get('frames')
+        metrics = {'generation': self.generation,
+                   'population': len(self.population),
+                   'evaluated': self.evaluation_info.get('evaluated'),
+                   'cache_hits': self.evaluation_info.get('cache_hits'),
+                   'episodes_played': self.evaluation_info.get('episodes_played'),
+                   'early_stopped': self.evaluation_info.get('early_stopped'),
+                   'truncated': int(np.count_nonzero(self.truncated)),
+                   'evaluation_seconds': evaluation_seconds,
+                   'frames': frames,
+                   'frames_per_second': frames / evaluation_seconds if frames and evaluation_seconds > 0 else None,
+                   'inference_seconds': self.evaluation_info.get('inference_seconds'),
+                   'breed_seconds': breed_seconds,
+                   'fitness_min': float(fitness.min()),
+                   'fitness_mean': float(fitness.mean()),
+                   'fitness_max': float(fitness.max()),
+                   'fitness_std': float(fitness.std())}
+        for q in (25, 50, 75, 90):
+            metrics['fitness_p{}'.format(q)] = float(np.percentile(fitness, q))
+
+        digests = [organism.digest() for organism in self.population]
+        metrics['unique_genomes'] = None if None in digests else len(set(digests)) / len(digests)
+        genes = [organism.genes() for organism in self.population]
+        # Mean over genes of their standard deviation across the population
+        metrics['gene_std'] = None if any(g is None for g in genes) else float(np.stack(genes).std(axis=0).mean())
+        return metrics
+
+    def cache_info(self):
+        """ Hits, misses and size of the fitness cache """
+        return self.cache.info()
 
     def offspring_generation(self, elite_organisms, n_offspring):
         """ Randomly selects parents to generate offspring. Also performs mutation """
-        offsprings = []
         elite_organisms = elite_organisms.tolist()
-        for _ in range(n_offspring):
-            parent1, parent2 = pyrandom.sample(elite_organisms, 2)
-            offsprings.append(parent1.breed(parent2))
-            if np.random.random() < self.mut_rate:
-                offsprings[-1].mutate()
-        return offsprings
+        parents = [pyrandom.sample(elite_organisms, 2) for _ in range(n_offspring)]
+        mutate = np.random.random(n_offspring) < self.mut_rate
+        return self.organism_type.breed_many([p[0] for p in parents], [p[1] for p in parents], mutate)
 
-    def evolve(self, generations=10, trace_evolution=False):
+    def evolve(self, generations=10, trace_evolution=False, checkpoint=None):
         """
         Evolution process
 
         :param generations: Number of generations
         :param trace_evolution: Boolean. To trace evolution the given selection_function must return the best organism
                                 as a second value if is requested
+        :param checkpoint: Optional callable checkpoint(genetic_alg) called after every generation, e.g.
+                           ia.checkpoint.Checkpointer
         :return: (int) generations processed is trace_evolution is False. Else generation processed plus tuple of best
                  organism per generation and its fitness
 
@@ -122,9 +443,14 @@ class GeneticAlg:
         fitness_evolution = []
         organism_evolution = []
         for i in range(generations):
-            print('Evaluating generation {}'.format(i + 1))
+            print('Evaluating generation {}'.format(self.generation + 1))
 
             best_organism = self.breed_new_generation()
+            if self.truncated.any():
+                print('{} of {} episodes truncated by limits'.format(np.count_nonzero(self.truncated),
+                                                                     len(self.truncated)))
+            if checkpoint is not None:
+                checkpoint(self)
 
             if trace_evolution:
                 organism_evolution.append(best_organism)
@@ -140,15 +466,34 @@ class GeneticAlg:
     def breed_new_generation(self):
         """ Creates a new generation """
         # Evaluate population fitness
+        start = time.perf_counter()
         self.fitness = self.calc_fitness()
+        evaluation_seconds = time.perf_counter() - start
 
         # Select population to give breed
+        start = time.perf_counter()
         elite_organisms, best_organism = self.selection_function(self.population, self.fitness, True)
 
         # Create new offsprings
         offsprings = self.offspring_generation(elite_organisms, self.population_size - len(elite_organisms))
+        breed_seconds = time.perf_counter() - start
+
+        self.generation += 1
+        if self.callbacks:
+            # Measured before replacing the population, so the metrics describe the evaluated organisms
+            metrics = self.generation_metrics(evaluation_seconds, breed_seconds)
+            for callback in self.callbacks:
+                callback(self, metrics)
 
         # Update population
+        evaluated = {id(organism): i for i, organism in enumerate(self.population)}
+        elite = [evaluated[id(organism)] for organism in elite_organisms]
+        self.population_fitness = np.concatenate((np.asarray(self.fitness, dtype=float)[elite],
+                                                  np.full(len(offsprings), np.nan)))
+        self.population_truncated = np.concatenate((self.truncated[elite], np.zeros(len(offsprings), dtype=bool)))
         self.population = np.concatenate((elite_organisms, offsprings))
 
+        if self.reseed_episodes:
+            self.episode_seeds = self.new_episode_seeds()
+
         return best_organism
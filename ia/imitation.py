@@ -0,0 +1,99 @@
+"""
+Warm start for GeneticAlg by imitation: a NeuralNetwork is trained with mini-batch backpropagation to reproduce the
+actions of a recorded player (see game.trace), and the initial population is seeded with noisy copies of it.
+
+Observations are raw distances in pixels, which saturate sigmoid neurons. Training uses standardized inputs and the
+standardization is folded into the first layer afterwards, so the resulting network takes the same raw observations
+as any other player.
+"""
+import numpy as np
+
+from ia.Genome import NetworkGenome
+from ia.NeuralNetwork import NeuralNetwork
+from ia.Neuron import Sigmoid
+
+# Output above which the player jumps, as game.engine.JUMP_THRESHOLD
+JUMP_THRESHOLD = 0.5
+
+
+def standardization(observations):
+    """ Mean and standard deviation of every input. Constant inputs get a deviation of 1 """
+    mean = observations.mean(axis=0)
+    std = observations.std(axis=0)
+    std[std == 0] = 1.
+    return mean, std
+
+
+def fold_standardization(network, mean, std):
+    """
+    Changes the first layer of network so that feeding it x gives the same outputs as feeding (x - mean) / std before
+    """
+    layer = network.get_layers()[0]
+    weights = layer.get_weights_matrix() / std[:, np.newaxis]
+    layer.set_parameters(weights, layer.get_bias_vector() - mean @ weights)
+    network.compile()
+
+
+def small_random_network(layers_conf, learning_rate):
+    """ Sigmoid network with weights scaled by 1 / sqrt(ninputs), which backpropagation can train """
+    weights = [np.random.standard_normal((ninputs, nneurons)) / np.sqrt(ninputs)
+               for ninputs, nneurons in zip(layers_conf[:-1], layers_conf[1:])]
+    biases = [np.zeros(nneurons) for nneurons in layers_conf[1:]]
+    return NeuralNetwork.from_parameters(weights, biases, learning_rate, Sigmoid)
+
+
+def train_imitation(observations, actions, layers_conf=(3, 8, 8, 8, 1), epochs=50, batch_size=64,
+                    learning_rate=2.):
+    """
+    :param observations: Matrix with one observation per row
+    :param actions: Boolean array, True where the recorded player jumped
+    :return: (NeuralNetwork that takes raw observations, list with the error of every epoch)
+    """
+    observations = np.asarray(observations, dtype=float)
+    expected = np.asarray(actions, dtype=float).reshape(-1, 1)
+    mean, std = standardization(observations)
+    inputs = (observations - mean) / std
+
+    network = small_random_network(list(layers_conf), learning_rate)
+    errors = []
+    for _ in range(epochs):
+        order = np.random.permutation(len(inputs))
+        epoch_error = 0.
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            epoch_error += network.train_batch(inputs[batch], expected[batch]) * len(batch)
+        errors.append(epoch_error / len(inputs))
+
+    fold_standardization(network, mean, std)
+    return network, errors
+
+
+def imitation_accuracy(network, observations, actions):
+    """ Fraction of observations where network takes the recorded action """
+    jumps = network.feed_forward(np.asarray(observations, dtype=float))[:, 0] > JUMP_THRESHOLD
+    return float(np.mean(jumps == np.asarray(actions, dtype=bool)))
+
+
+def warm_start_organisms(network, organism_type, n, noise=.05):
+    """
+    Organisms to seed GeneticAlg's initial population: the first one has the genes of network and the rest add
+    Gaussian noise to them.
+
+    The noise is scaled separately for the weights and for the biases of every layer. After fold_standardization the
+    first layer weights are much smaller than the rest, and a single scale for all genes would wipe them out.
+
+    :param organism_type: Class with a from_genome classmethod, such as NetworkOrganism
+    :param noise: Standard deviation of the noise relative to the mean absolute value of the weights (or biases) of
+                  the same layer
+    """
+    genome = NetworkGenome.from_network(network)
+    # (weights, biases) noise scale of every layer
+    scales = [(noise * np.abs(rows[:, :-1]).mean(), noise * np.abs(rows[:, -1]).mean()) for rows in genome.layers]
+    organisms = [organism_type.from_genome(genome)]
+    for _ in range(n - 1):
+        noisy = genome.copy()
+        for rows, (weights_scale, biases_scale) in zip(noisy.layers, scales):
+            rows[:, :-1] += np.random.standard_normal(rows[:, :-1].shape) * weights_scale
+            rows[:, -1] += np.random.standard_normal(len(rows)) * biases_scale
+        organisms.append(organism_type.from_genome(noisy))
+    return organisms
@@ -0,0 +1,214 @@
+"""
+Island model: several GeneticAlg sub-populations evolve independently, each in its own process, and every few
+generations send their best organisms to the next island of a ring.
+
+Migrants travel as packed gene matrices (see ia.Genome) through a broker of mailboxes, one queue per island, served by
+a multiprocessing manager. run_islands starts a local broker and one process per island. To spread the islands over
+several machines, serve the broker on one of them and run each island with evolve_island and a Broker pointing to it:
+
+    key = new_authkey()
+    serve_broker(('broker-host', 50000), 4, key)                                        # broker node
+    evolve_island(factory, island, 4, Broker(('broker-host', 50000), key), generations)  # every island
+
+The manager exchanges pickles, so whoever knows the key can run code on the broker and on every island. There is no
+default key: keep it secret, and serve the broker only on a trusted network since the traffic is not encrypted.
+
+Islands never wait for each other: migrants are read whenever they have arrived, so runs are not reproducible even
+with a seed.
+"""
+import multiprocessing as mp
+import os
+import queue
+import random as pyrandom
+from collections import namedtuple
+from multiprocessing.managers import BaseManager
+
+import numpy as np
+
+from ia.Genome import NetworkGenome
+from ia.evaluation import population_genes
+
+# Best organisms of an island: gene matrix with one organism per row, as in ia.evaluation.population_genes
+Migrants = namedtuple('Migrants', ['source', 'generation', 'layers_conf', 'genes', 'fitness'])
+# Best organism an island found during its whole run
+IslandResult = namedtuple('IslandResult', ['island', 'layers_conf', 'genes', 'fitness', 'generation', 'immigrants'])
+
+_mailboxes = []
+
+
+def _init_mailboxes(n_islands):
+    _mailboxes[:] = [queue.Queue() for _ in range(n_islands)]
+
+
+def _mailbox(island):
+    return _mailboxes[island]
+
+
+class BrokerManager(BaseManager):
+    """ Serves the mailbox of every island """
+
+
+BrokerManager.register('mailbox', callable=_mailbox)
+
+
+def new_authkey():
+    """ Random key for a broker """
+    return os.urandom(32).hex().encode()
+
+
+def start_broker(n_islands, authkey):
+    """ Starts a broker in a local server process. Call shutdown() on the returned manager when done """
+    manager = BrokerManager(address=('127.0.0.1', 0), authkey=authkey)
+    manager.start(_init_mailboxes, (n_islands,))
+    return manager
+
+
+def serve_broker(address, n_islands, authkey):
+    """ Serves the mailboxes of n_islands islands at address (host, port) until the process is killed """
+    _init_mailboxes(n_islands)
+    BrokerManager(address=address, authkey=authkey).get_server().serve_forever()
+
+
+class Broker:
+    """
+    Connection of an island to the mailboxes of a broker. It connects on first use, so it can be passed to child
+    processes before connecting.
+    """
+
+    def __init__(self, address, authkey):
+        self.address = address
+        self.authkey = authkey
+        self.manager = None
+        self.mailboxes = {}
+
+    def mailbox(self, island):
+        if self.manager is None:
+            self.manager = BrokerManager(address=self.address, authkey=self.authkey)
+            self.manager.connect()
+        if island not in self.mailboxes:
+            self.mailboxes[island] = self.manager.mailbox(island)
+        return self.mailboxes[island]
+
+    def send(self, island, migrants):
+        self.mailbox(island).put(migrants)
+
+    def receive(self, island):
+        """ Every Migrants waiting in the mailbox of island, without blocking """
+        mailbox = self.mailbox(island)
+        arrived = []
+        while True:
+            try:
+                arrived.append(mailbox.get_nowait())
+            except queue.Empty:
+                return arrived
+
+    def __getstate__(self):
+        return {'address': self.address, 'authkey': self.authkey, 'manager': None, 'mailboxes': {}}
+
+
+class Migration:
+    """
+    GeneticAlg callback that sends the best 'migrants' organisms of every 'interval'-th generation to the next island
+    of the ring. immigrate puts the organisms received from the previous island into the new generation.
+    """
+
+    def __init__(self, broker, island, n_islands, interval=5, migrants=2):
+        self.broker = broker
+        self.island = island
+        self.n_islands = n_islands
+        self.interval = interval
+        self.migrants = migrants
+        self.sent = 0
+        self.received = 0
+
+    def __call__(self, genetic_alg, metrics):
+        # Called before the population is replaced, so population and fitness still match
+        if self.n_islands < 2 or genetic_alg.generation % self.interval:
+            return
+        best = np.argsort(genetic_alg.fitness)[::-1][:self.migrants]
+        layers_conf, genes = population_genes(genetic_alg.population[best])
+        self.broker.send((self.island + 1) % self.n_islands,
+                         Migrants(self.island, genetic_alg.generation, list(layers_conf), genes,
+                                  np.asarray(genetic_alg.fitness, dtype=float)[best]))
+        self.sent += len(best)
+
+    def immigrate(self, genetic_alg):
+        """
+        Replaces the last organisms of the population, which are offspring, with the migrants that have arrived. At
+        most half of the population is replaced, so the elite survives.
+
+        :return: Number of organisms received
+        """
+        if self.n_islands < 2:
+            return 0
+        organisms = [genetic_alg.organism_type.from_genome(NetworkGenome(migrants.layers_conf, row.copy()))
+                     for migrants in self.broker.receive(self.island) for row in migrants.genes]
+        organisms = organisms[-(len(genetic_alg.population) // 2):]
+        for i, organism in enumerate(organisms):
+            genetic_alg.population[len(genetic_alg.population) - len(organisms) + i] = organism
+        self.received += len(organisms)
+        return len(organisms)
+
+
+def evolve_island(genetic_alg_factory, island, n_islands, broker, generations, interval=5, migrants=2, seed=None):
+    """
+    Evolves one island for 'generations' generations, migrating every 'interval' generations.
+
+    :param genetic_alg_factory: Function genetic_alg_factory(island, seed) that builds the GeneticAlg of an island.
+                                Its organism_type must implement the classmethod from_genome(NetworkGenome). It must
+                                be picklable to run islands in child processes
+    :param seed: The island i uses seed + i
+    :return: IslandResult with the best organism found
+    """
+    if seed is None:
+        # Forked islands inherit the random state of their parent and would evolve the same organisms
+        pyrandom.seed()
+        np.random.seed()
+    genetic_alg = genetic_alg_factory(island, None if seed is None else seed + island)
+    migration = Migration(broker, island, n_islands, interval, migrants)
+    genetic_alg.add_callback(migration)
+
+    best_genes, best_fitness, best_generation, layers_conf = None, -np.inf, 0, None
+    for _ in range(generations):
+        best_organism = genetic_alg.breed_new_generation()
+        if best_organism.fitness > best_fitness:
+            layers_conf, genes = population_genes([best_organism])
+            best_genes, best_fitness, best_generation = genes[0], float(best_organism.fitness), genetic_alg.generation
+        migration.immigrate(genetic_alg)
+    return IslandResult(island, list(layers_conf), best_genes, best_fitness, best_generation, migration.received)
+
+
+def _island_process(results, *args):
+    results.put(evolve_island(*args))
+
+
+def run_islands(genetic_alg_factory, n_islands, generations, interval=5, migrants=2, seed=None):
+    """
+    Evolves n_islands islands in parallel processes on this machine, with a local broker. See evolve_island.
+
+    :return: List with the IslandResult of every island, ordered by island
+    """
+    authkey = new_authkey()
+    manager = start_broker(n_islands, authkey)
+    try:
+        broker = Broker(manager.address, authkey)
+        results = mp.Queue()
+        processes = [mp.Process(target=_island_process,
+                                args=(results, genetic_alg_factory, island, n_islands, broker, generations, interval,
+                                      migrants, seed))
+                     for island in range(n_islands)]
+        for process in processes:
+            process.start()
+        # Results are read before joining, a process does not end while its result is still in the queue buffer
+        island_results = []
+        while len(island_results) < n_islands:
+            try:
+                island_results.append(results.get(timeout=1))
+            except queue.Empty:
+                if not any(process.is_alive() for process in processes) and results.empty():
+                    raise RuntimeError('{} islands ended without a result'.format(n_islands - len(island_results)))
+        for process in processes:
+            process.join()
+    finally:
+        manager.shutdown()
+    return sorted(island_results, key=lambda result: result.island)
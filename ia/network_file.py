@@ -0,0 +1,111 @@
+"""
+Binary file format for trained networks.
+
+Layout:
+
+- MAGIC (8 bytes)
+- Format version and header length, two little endian uint32
+- UTF-8 JSON header: layers_conf, neuron_type, learning_rate and optional metadata
+- Zero padding up to a multiple of ALIGNMENT bytes
+- Every weight and bias as little endian float64, in the layout of ia.Genome.NetworkGenome (one row per neuron with
+  its weights followed by its bias, layer after layer)
+
+Since the parameters are one aligned block, load_compiled can memory-map them and build a CompiledNetwork whose
+matrices are views of the file, without creating Neuron objects or random weights.
+"""
+import json
+import struct
+
+import numpy as np
+
+from ia.Genome import NetworkGenome, genome_size
+from ia.NeuralNetwork import NeuralNetwork
+from ia.Neuron import Neuron, Perceptron, Sigmoid
+
+MAGIC = b'FLAPPYNN'
+VERSION = 1
+ALIGNMENT = 64
+DTYPE = np.dtype('<f8')
+
+NEURON_TYPES = {neuron_type.__name__: neuron_type for neuron_type in (Neuron, Perceptron, Sigmoid)}
+
+
+def network_neuron_type(network):
+    """ Neuron class of a NeuralNetwork, or the one whose activation function a CompiledNetwork uses """
+    if isinstance(network, NeuralNetwork):
+        return network.neuron_type
+    activations = set(network.activations)
+    assert len(activations) == 1, 'Every layer must use the same activation function'
+    for neuron_type in NEURON_TYPES.values():
+        if neuron_type.activation_function in activations:
+            return neuron_type
+    raise ValueError('No neuron type uses the activation function {}'.format(activations.pop()))
+
+
+def save_network(path, network, metadata=None):
+    """
+    :param network: NeuralNetwork or CompiledNetwork
+    :param metadata: Optional JSON serializable dictionary stored with the network, e.g. its fitness
+    """
+    genome = NetworkGenome.from_network(network)
+    header = {'layers_conf': genome.layers_conf,
+              'neuron_type': network_neuron_type(network).__name__,
+              'learning_rate': getattr(network, 'lr', None),
+              'metadata': metadata or {}}
+    header_bytes = json.dumps(header).encode('utf-8')
+    prefix = MAGIC + struct.pack('<II', VERSION, len(header_bytes)) + header_bytes
+    padding = -len(prefix) % ALIGNMENT
+
+    with open(path, 'wb') as f:
+        f.write(prefix)
+        f.write(b'\0' * padding)
+        f.write(genome.data.astype(DTYPE).tobytes())
+
+
+def read_header(path):
+    """
+    :return: (header dictionary, offset in bytes of the parameters)
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError('{} is not a network file'.format(path))
+        version, header_length = struct.unpack('<II', f.read(8))
+        if version != VERSION:
+            raise ValueError('Unsupported network file version {} in {}'.format(version, path))
+        header = json.loads(f.read(header_length).decode('utf-8'))
+    offset = len(MAGIC) + 8 + header_length
+    return header, offset + (-offset % ALIGNMENT)
+
+
+def load_genome(path, mmap=True):
+    """
+    :param mmap: Map the parameters from the file instead of reading them into memory. The genome is read only
+    :return: (NetworkGenome, header dictionary)
+    """
+    header, offset = read_header(path)
+    size = genome_size(header['layers_conf'])
+    if mmap:
+        data = np.memmap(path, dtype=DTYPE, mode='r', offset=offset, shape=(size,))
+    else:
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = np.fromfile(f, dtype=DTYPE, count=size)
+        if len(data) != size:
+            raise ValueError('{} is truncated'.format(path))
+    return NetworkGenome(header['layers_conf'], data), header
+
+
+def load_compiled(path, mmap=True):
+    """ CompiledNetwork for inference, with its matrices mapped from the file when mmap is True """
+    genome, header = load_genome(path, mmap)
+    return genome.compile(NEURON_TYPES[header['neuron_type']].activation_function)
+
+
+def load_network(path):
+    """ NeuralNetwork with its Neuron objects, e.g. to keep training or evolving it """
+    genome, header = load_genome(path, mmap=False)
+    nlayers = len(genome.layers)
+    learning_rate = header['learning_rate'] if header['learning_rate'] is not None else .1
+    return NeuralNetwork.from_parameters([genome.weights(i) for i in range(nlayers)],
+                                         [genome.biases(i) for i in range(nlayers)],
+                                         learning_rate, NEURON_TYPES[header['neuron_type']])
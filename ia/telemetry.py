@@ -0,0 +1,90 @@
+"""
+Callbacks for GeneticAlg that record or watch the metrics of every generation (see GeneticAlg.generation_metrics).
+
+    genetic_alg.add_callback(JsonLinesWriter('metrics.jsonl'))
+    genetic_alg.add_callback(ThroughputMonitor())
+"""
+import csv
+import json
+import warnings
+
+import numpy as np
+
+
+class JsonLinesWriter:
+    """ Appends one JSON object per generation to a file """
+
+    def __init__(self, path):
+        self.path = path
+
+    def __call__(self, genetic_alg, metrics):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(metrics) + '\n')
+
+
+class CsvWriter:
+    """
+    Appends one row per generation to a CSV file. The header is written when the file is empty. A file whose header
+    does not match the metrics is refused, so rows of different runs never end up under the wrong columns
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.fieldnames = None
+
+    def __call__(self, genetic_alg, metrics):
+        fieldnames = list(metrics)
+        with open(self.path, 'a+', newline='') as f:
+            if f.tell() == 0:
+                csv.writer(f).writerow(fieldnames)
+            elif fieldnames != self.fieldnames:
+                f.seek(0)
+                header = next(csv.reader(f), [])
+                if header != fieldnames:
+                    raise ValueError('The columns of {} do not match the metrics: {} instead of {}'.format(
+                        self.path, header, fieldnames))
+            self.fieldnames = fieldnames
+            csv.DictWriter(f, fieldnames=fieldnames).writerow(metrics)
+
+
+def metrics_writer(path):
+    """ CsvWriter for .csv files, JsonLinesWriter for any other extension """
+    return CsvWriter(path) if path.endswith('.csv') else JsonLinesWriter(path)
+
+
+class PrintMetrics:
+    """ Prints a one line summary of every generation """
+
+    def __call__(self, genetic_alg, metrics):
+        frames_per_second = metrics['frames_per_second']
+        print('Generation {generation}: fitness max {fitness_max:.3f} mean {fitness_mean:.3f}, '
+              'evaluated {evaluated} in {evaluation_seconds:.3f}s, breed {breed_seconds:.3f}s'.format(**metrics) +
+              ('' if frames_per_second is None else ', {:.0f} frames/s'.format(frames_per_second)))
+
+
+class ThroughputMonitor:
+    """
+    Warns when the frames per second of a generation drop below a fraction of the median of the previous ones.
+    Generations without frame counts are ignored
+    """
+
+    def __init__(self, min_ratio=.5, window=10):
+        """
+        :param min_ratio: Warn when frames_per_second < min_ratio * median of the last 'window' generations
+        """
+        self.min_ratio = min_ratio
+        self.window = window
+        self.history = []
+        self.alerts = 0
+
+    def __call__(self, genetic_alg, metrics):
+        frames_per_second = metrics['frames_per_second']
+        if frames_per_second is None:
+            return
+        if self.history:
+            median = float(np.median(self.history[-self.window:]))
+            if frames_per_second < self.min_ratio * median:
+                self.alerts += 1
+                warnings.warn('Generation {} simulated {:.0f} frames/s, median of the previous ones is {:.0f}'.format(
+                    metrics['generation'], frames_per_second, median))
+        self.history.append(frames_per_second)
@@ -1,68 +1,326 @@
+import argparse
+import functools
 import multiprocessing as mp
-from queue import Empty as EmptyQueue
-from datetime import datetime
+import os
 
-from game.flappy import FlappyGame, GameStates, K_SPACE, K_RETURN
-from ia.EvolutionaryNetwork import NetworkOrganism, GeneticAlg, network_fitness, selection_function
-from copy import copy
-
-JUMP_KEY = K_SPACE
-START_KEY = K_RETURN
-RESET_KEY = K_RETURN
+import numpy as np
 
-ACTIONS_DICT = {START_KEY: 0, JUMP_KEY: 0, RESET_KEY: 0}
+from game.batch import play_networks
+from game.channel import SharedChannel, Actions, ChannelTimeout
+from game.engine import EpisodeLimits, NO_LIMITS
+from game.trace import TraceReader, TraceWriter
+from ia.EvolutionaryNetwork import NetworkOrganism, GeneticAlg, network_fitness, selection_function
+from ia.genetic_algorithm import EarlyStopping
+from ia.checkpoint import Checkpointer, restore_checkpoint
+from ia.evaluation import SequentialEvaluator, PoolEvaluator
+from ia.Genome import NetworkGenome
+from ia.imitation import train_imitation, imitation_accuracy, warm_start_organisms
+from ia.islands import Broker, evolve_island, new_authkey, run_islands, serve_broker
+from ia.network_file import save_network
+from ia.telemetry import metrics_writer, ThroughputMonitor
 
-JUMP_ACTION = copy(ACTIONS_DICT)
-JUMP_ACTION[JUMP_KEY] = 1
-START_ACTION = copy(ACTIONS_DICT)
-START_ACTION[START_KEY] = 1
-RESET_ACTION = copy(ACTIONS_DICT)
-RESET_ACTION[RESET_KEY] = 1
+JUMP_ACTION = Actions.JUMP
+START_ACTION = Actions.ENTER
+RESET_ACTION = Actions.ENTER
+NO_ACTION = Actions.NONE
 
 
-def run(game_instance, state_queue, actions_queue):
+def run(game_instance, channel, trace_path=None):
     print("Corriendo Flappy ...")
-    game_instance.execute(state_queue, actions_queue)
+    if trace_path is not None:
+        # Se abre en el proceso del juego, que es el que graba los cuadros
+        game_instance.recorder = TraceWriter(trace_path)
+    game_instance.execute(channel=channel, lockstep=True)
+    if game_instance.recorder is not None:
+        game_instance.recorder.close()
     print("Juego terminado")
     exit(0)
 
 
-def ia_player_handler(player, action_queue, state, data=None):
+def ia_player_handler(player, channel, frame_seq, state, data=None):
     """
-    Hace jugar a un jugador artificial.
+    Hace jugar a un jugador artificial respondiendo al cuadro frame_seq.
     Retorna True si aún está jugando. False si ya terminó
     """
     if state == GameStates.START:
-        action_queue.put(START_ACTION)
+        channel.send_action(frame_seq, START_ACTION)
         return True
     elif state == GameStates.RESET:
         player.fitness = data  # Actualiza el score
-        # start = datetime.now()
-        # while True:
-        #     actions_queue.put(RESET_ACTION)  # Trata de resetear el juego durante 1 segundo
-        #     if (datetime.now() - start).total_seconds() > 1:
-        #         break
-        actions_queue.put(RESET_ACTION)
+        channel.send_action(frame_seq, RESET_ACTION)
         return False
     elif state == GameStates.PLAYING:
         network_output = player.network.feed_forward(data)  # Recibe la data de distancias
         perform_jump = True if network_output[0] > 0.5 else False  # Transformar salida de la red a si salta o no salta
-        if perform_jump:
-            action_queue.put(JUMP_ACTION)
+        channel.send_action(frame_seq, JUMP_ACTION if perform_jump else NO_ACTION)
         return True
 
 
+def metrics_callbacks(metrics_path):
+    """ Callbacks que guardan las métricas de cada generación en metrics_path (.csv o JSON lines) """
+    if metrics_path is None:
+        return []
+    return [metrics_writer(metrics_path), ThroughputMonitor()]
+
+
+def imitation_population(trace_path, n):
+    """
+    n organismos entrenados para imitar las jugadas grabadas en el trace trace_path (ver game.trace e ia.imitation)
+    """
+    observations, actions = TraceReader(trace_path).observations()
+    network, errors = train_imitation(observations, actions)
+    print("Red entrenada con {} cuadros: error {:.4f}, acierto {:.1%}".format(
+        len(actions), errors[-1], imitation_accuracy(network, observations, actions)))
+    return warm_start_organisms(network, NetworkOrganism, n)
+
+
+def aggregate_arg(value):
+    """ Tipo de --aggregate: mean, min o un cuantil """
+    return value if value in ('mean', 'min') else float(value)
+
+
+def address_arg(value):
+    """ Tipo de las direcciones host:puerto del broker de islas """
+    host, port = value.rsplit(':', 1)
+    return host, int(port)
+
+
+def resume_if_requested(GA, checkpoint_path, resume):
+    if resume and checkpoint_path is not None and os.path.exists(checkpoint_path):
+        restore_checkpoint(GA, checkpoint_path)
+        print("Continuando desde la generación {} guardada en {}".format(GA.generation, checkpoint_path))
+
+
+def evolve_headless(generations, processes=1, seed=None, fixed_episode=False, cache_size=1024, limits=NO_LIMITS,
+                    generation_time_budget=None, checkpoint_path=None, checkpoint_every=1, resume=False,
+                    save_best=None, metrics_path=None, warm_start=None, warm_start_fraction=.5, spectator=None,
+                    episodes=1, aggregate='mean', early_stopping=False, trace_path=None):
+    """
+    Evoluciona la población sin dibujar el juego ni limitar los FPS.
+    Cada generación juega al mismo tiempo en un BatchFlappyEngine, repartida entre 'processes' procesos.
+    Si hay spectator (game.spectator.SpectatorGame) cada generación se dibuja completa mientras juega, en este proceso.
+    Con fixed_episode todas las generaciones juegan el mismo episodio, así los sobrevivientes no se vuelven a evaluar.
+    limits corta los episodios de las aves que ya no chocan y generation_time_budget acota los segundos por generación.
+    Si hay checkpoint_path se guarda el estado cada checkpoint_every generaciones, y con resume se continúa desde él.
+    Si hay save_best se guarda ahí la red del organismo con mayor fitness de todas las generaciones (ver
+    ia.network_file).
+    Si hay metrics_path se guardan ahí las métricas de cada generación (ver ia.telemetry).
+    Si hay warm_start, una fracción warm_start_fraction de la población inicial imita las jugadas de ese archivo.
+    Cada organismo juega 'episodes' episodios con semillas distintas y su fitness los resume según aggregate (ver
+    ia.genetic_algorithm.aggregate_episodes). Con early_stopping los organismos claramente peores dejan de jugar antes.
+    Si hay trace_path se graban ahí los cuadros de cada episodio jugado (ver game.trace); necesita processes 1.
+    """
+    recorder = TraceWriter(trace_path) if trace_path is not None else None
+    play_function = functools.partial(play_networks if spectator is None else spectator.play_networks, limits=limits,
+                                      recorder=recorder)
+    if processes > 1 and spectator is None:
+        assert recorder is None, 'Los episodios jugados en otros procesos no se pueden grabar'
+        evaluator = PoolEvaluator(play_function, batched=True, processes=processes)
+    else:
+        evaluator = SequentialEvaluator(play_function, batched=True)
+    initial_population = None
+    if warm_start is not None:
+        if seed is not None:
+            np.random.seed(seed)
+        initial_population = imitation_population(warm_start, int(20 * warm_start_fraction))
+    GA = GeneticAlg(pop_size=20, organism_type=NetworkOrganism, fitness_function=network_fitness,
+                    selection_function=selection_function, mutation_rate=.1, evaluator=evaluator, seed=seed,
+                    reseed_episodes=not fixed_episode, cache_size=cache_size,
+                    generation_time_budget=generation_time_budget, callbacks=metrics_callbacks(metrics_path),
+                    initial_population=initial_population, episodes=episodes, aggregate=aggregate,
+                    early_stopping=EarlyStopping() if early_stopping else None)
+    resume_if_requested(GA, checkpoint_path, resume)
+    checkpoint = Checkpointer(checkpoint_path, checkpoint_every) if checkpoint_path is not None else None
+    _, best_organisms, best_fitness = GA.evolve(generations=generations, trace_evolution=True, checkpoint=checkpoint)
+    if save_best is not None:
+        best = int(np.argmax(best_fitness))
+        save_network(save_best, best_organisms[best].network,
+                     metadata={'fitness': float(best_fitness[best]),
+                               'generation': GA.generation - len(best_fitness) + 1 + best})
+        print("Mejor red guardada en {}".format(save_best))
+    print("Fitness última generación")
+    print(GA.fitness)
+    print("Cache de fitness: {}".format(GA.cache_info()))
+    if isinstance(evaluator, PoolEvaluator):
+        evaluator.close()
+    if recorder is not None:
+        recorder.close()
+        print("{} cuadros grabados en {}".format(recorder.recorded, trace_path))
+
+
+def island_metrics_path(metrics_path, island):
+    """ Cada isla guarda sus métricas en su propio archivo: metrics.jsonl -> metrics.island0.jsonl """
+    if metrics_path is None:
+        return None
+    root, extension = os.path.splitext(metrics_path)
+    return '{}.island{}{}'.format(root, island, extension)
+
+
+def island_genetic_alg(island, seed=None, pop_size=20, fixed_episode=False, cache_size=1024, limits=NO_LIMITS,
+                       generation_time_budget=None, metrics_path=None, warm_start=None, warm_start_fraction=.5,
+                       episodes=1, aggregate='mean', early_stopping=False):
+    """
+    GeneticAlg de una isla (ver ia.islands). Cada isla evalúa su población en su propio proceso. Los parámetros son
+    los de evolve_headless; con warm_start cada isla entrena su propia red imitadora
+    """
+    evaluator = SequentialEvaluator(functools.partial(play_networks, limits=limits), batched=True)
+    initial_population = None
+    if warm_start is not None:
+        if seed is not None:
+            np.random.seed(seed)
+        initial_population = imitation_population(warm_start, int(pop_size * warm_start_fraction))
+    return GeneticAlg(pop_size=pop_size, organism_type=NetworkOrganism, fitness_function=network_fitness,
+                      selection_function=selection_function, mutation_rate=.1, evaluator=evaluator, seed=seed,
+                      reseed_episodes=not fixed_episode, cache_size=cache_size,
+                      generation_time_budget=generation_time_budget,
+                      callbacks=metrics_callbacks(island_metrics_path(metrics_path, island)),
+                      initial_population=initial_population, episodes=episodes, aggregate=aggregate,
+                      early_stopping=EarlyStopping() if early_stopping else None)
+
+
+def evolve_islands(generations, n_islands, interval=5, migrants=2, seed=None, broker_address=None, island=None,
+                   authkey=None, save_best=None, **kwargs):
+    """
+    Evoluciona n_islands poblaciones independientes que cada 'interval' generaciones envían sus 'migrants' mejores
+    organismos a la isla siguiente (ver ia.islands).
+    Sin broker_address todas las islas corren en procesos de esta máquina. Con broker_address solo se evoluciona la
+    isla 'island', conectada con la clave authkey al broker que sirve otra máquina con --serve-broker.
+    Si hay save_best se guarda ahí la red del mejor organismo encontrado. El resto de kwargs van a island_genetic_alg.
+    """
+    factory = functools.partial(island_genetic_alg, **kwargs)
+    if broker_address is None:
+        results = run_islands(factory, n_islands, generations, interval, migrants, seed)
+    else:
+        results = [evolve_island(factory, island, n_islands, Broker(broker_address, authkey), generations, interval,
+                                 migrants, seed)]
+    for result in results:
+        print("Isla {}: mejor fitness {:.3f} en la generación {}, {} inmigrantes".format(
+            result.island, result.fitness, result.generation, result.immigrants))
+    best = max(results, key=lambda result: result.fitness)
+    if save_best is not None:
+        network = NetworkOrganism.from_genome(NetworkGenome(best.layers_conf, best.genes)).network
+        save_network(save_best, network, metadata={'fitness': best.fitness, 'generation': best.generation,
+                                                   'island': best.island})
+        print("Mejor red guardada en {}".format(save_best))
+
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Flappy IA')
+    parser.add_argument('--headless', action='store_true', help='Evoluciona sin ventana y sin límite de FPS')
+    parser.add_argument('--spectate', action='store_true',
+                        help='Evoluciona como --headless, pero dibuja cada generación completa mientras juega')
+    parser.add_argument('--fps', type=int, default=60, help='Límite de cuadros dibujados por segundo con --spectate')
+    parser.add_argument('--render-every', type=int, default=None,
+                        help='Con ventana, dibuja uno de cada N cuadros simulados para no frenar la simulación. '
+                             'Por defecto 1, o 4 con --spectate')
+    parser.add_argument('--generations', type=int, default=10, help='Generaciones a evolucionar en modo headless')
+    parser.add_argument('--seed', type=int, default=None, help='Semilla para reproducir la evolución en modo headless')
+    parser.add_argument('--fixed-episode', action='store_true', help='Todas las generaciones juegan el mismo episodio')
+    parser.add_argument('--processes', type=int, default=1, help='Procesos para evaluar cada generación en modo headless')
+    parser.add_argument('--max-ticks', type=int, default=None, help='Cuadros máximos por episodio')
+    parser.add_argument('--max-score', type=int, default=None, help='Puntaje con el que se corta un episodio')
+    parser.add_argument('--episode-seconds', type=float, default=None, help='Segundos máximos por episodio')
+    parser.add_argument('--generation-seconds', type=float, default=None,
+                        help='Segundos máximos para evaluar una generación en modo headless')
+    parser.add_argument('--checkpoint', default=None, help='Archivo .npz donde se guarda el estado de la evolución')
+    parser.add_argument('--checkpoint-every', type=int, default=1, help='Generaciones entre checkpoints')
+    parser.add_argument('--resume', action='store_true', help='Continúa la evolución desde --checkpoint si existe')
+    parser.add_argument('--save-best', default=None, help='Archivo donde se guarda la mejor red en modo headless')
+    parser.add_argument('--metrics', default=None, help='Archivo .csv o .jsonl con las métricas de cada generación')
+    parser.add_argument('--warm-start', default=None,
+                        help='Trace (ver game.trace) con jugadas que imita parte de la población inicial')
+    parser.add_argument('--warm-start-fraction', type=float, default=.5,
+                        help='Fracción de la población inicial que imita las jugadas de --warm-start')
+    parser.add_argument('--trace', default=None,
+                        help='Directorio donde se graban cuadro a cuadro los episodios jugados (ver game.trace). Los '
+                             'organismos cuyo fitness sale del caché no vuelven a jugar')
+    parser.add_argument('--episodes', type=int, default=1,
+                        help='Episodios con semillas distintas que juega cada organismo por generación en modo headless')
+    parser.add_argument('--aggregate', type=aggregate_arg, default='mean',
+                        help='Resumen de los episodios de un organismo: mean, min o un cuantil entre 0 y 1')
+    parser.add_argument('--early-stopping', action='store_true',
+                        help='Con --episodes, los organismos claramente peores dejan de jugar los episodios restantes')
+    parser.add_argument('--islands', type=int, default=1,
+                        help='Poblaciones que evolucionan en paralelo, cada una en su proceso, intercambiando organismos')
+    parser.add_argument('--island-population', type=int, default=20, help='Organismos de cada isla')
+    parser.add_argument('--migration-interval', type=int, default=5, help='Generaciones entre migraciones')
+    parser.add_argument('--migrants', type=int, default=2, help='Mejores organismos que envía cada isla al migrar')
+    parser.add_argument('--serve-broker', type=address_arg, default=None, metavar='HOST:PUERTO',
+                        help='Sirve los buzones de --islands islas para que otras máquinas se conecten')
+    parser.add_argument('--broker', type=address_arg, default=None, metavar='HOST:PUERTO',
+                        help='Evoluciona solo la isla --island conectada al broker de --serve-broker')
+    parser.add_argument('--island', type=int, default=0, help='Índice de la isla que se evoluciona con --broker')
+    parser.add_argument('--broker-key', default=None,
+                        help='Clave secreta del broker. --broker la necesita; --serve-broker genera una si no se da')
+    args = parser.parse_args()
+    episode_limits = EpisodeLimits(args.max_ticks, args.max_score, args.episode_seconds)
+
+    if args.broker is not None and args.broker_key is None:
+        parser.error('--broker necesita la clave del broker en --broker-key')
+    broker_key = args.broker_key.encode() if args.broker_key is not None else None
+    if args.serve_broker is not None:
+        broker_key = broker_key or new_authkey()
+        print("Broker de {} islas en {}:{}, clave {}".format(args.islands, *args.serve_broker, broker_key.decode()))
+        serve_broker(args.serve_broker, args.islands, broker_key)
+
+    if args.islands > 1 or args.broker is not None:
+        # Cada isla ya corre en su propio proceso y las islas no tienen checkpoints
+        for flag, given in (('--processes', args.processes != 1), ('--checkpoint', args.checkpoint is not None),
+                            ('--resume', args.resume), ('--spectate', args.spectate),
+                            ('--trace', args.trace is not None)):
+            if given:
+                parser.error('{} no se puede usar con --islands o --broker'.format(flag))
+        evolve_islands(args.generations, args.islands, args.migration_interval, args.migrants, args.seed,
+                       broker_address=args.broker, island=args.island, authkey=broker_key,
+                       save_best=args.save_best, pop_size=args.island_population, fixed_episode=args.fixed_episode,
+                       limits=episode_limits, generation_time_budget=args.generation_seconds,
+                       metrics_path=args.metrics, warm_start=args.warm_start,
+                       warm_start_fraction=args.warm_start_fraction, episodes=args.episodes,
+                       aggregate=args.aggregate, early_stopping=args.early_stopping)
+        exit(0)
+
+    if args.headless or args.spectate:
+        if args.trace is not None and args.processes != 1 and not args.spectate:
+            parser.error('--trace graba los episodios en este proceso, no se puede usar con --processes')
+        spectator = None
+        if args.spectate:
+            # pygame solo se necesita para dibujar, así el modo headless corre en máquinas sin pygame
+            from game.spectator import SpectatorGame
+            spectator = SpectatorGame(args.render_every or 4, args.fps)
+        evolve_headless(args.generations, args.processes, args.seed, args.fixed_episode, limits=episode_limits,
+                        generation_time_budget=args.generation_seconds, checkpoint_path=args.checkpoint,
+                        checkpoint_every=args.checkpoint_every, resume=args.resume, save_best=args.save_best,
+                        metrics_path=args.metrics, warm_start=args.warm_start,
+                        warm_start_fraction=args.warm_start_fraction, spectator=spectator, episodes=args.episodes,
+                        aggregate=args.aggregate, early_stopping=args.early_stopping, trace_path=args.trace)
+        exit(0)
+
+    # Con ventana cada organismo juega un episodio del juego, que sortea sus propios tubos y no tiene evaluador
+    for flag, given in (('--seed', args.seed is not None), ('--fixed-episode', args.fixed_episode),
+                        ('--processes', args.processes != 1), ('--generation-seconds', args.generation_seconds),
+                        ('--save-best', args.save_best is not None), ('--episodes', args.episodes != 1),
+                        ('--aggregate', args.aggregate != 'mean'), ('--early-stopping', args.early_stopping)):
+        if given:
+            parser.error('{} solo se puede usar con --headless, --spectate o --islands'.format(flag))
+
+    # El juego con ventana necesita pygame
+    from game.flappy import FlappyGame, GameStates
+
     # Set neural networks to evolve
 
+    initial_population = None
+    if args.warm_start is not None:
+        initial_population = imitation_population(args.warm_start, int(20 * args.warm_start_fraction))
     GA = GeneticAlg(pop_size=20, organism_type=NetworkOrganism, fitness_function=network_fitness,
-                    selection_function=selection_function, mutation_rate=.1)
+                    selection_function=selection_function, mutation_rate=.1,
+                    callbacks=metrics_callbacks(args.metrics), initial_population=initial_population)
+    resume_if_requested(GA, args.checkpoint, args.resume)
+    checkpoint = Checkpointer(args.checkpoint, args.checkpoint_every) if args.checkpoint is not None else None
 
     # Init and run game
-    game = FlappyGame()
-    state_queue = mp.Queue()
-    actions_queue = mp.Queue()
-    game_process = mp.Process(target=run, args=(game, state_queue, actions_queue))
+    game = FlappyGame(limits=episode_limits, render_every=args.render_every or 1)
+    channel = SharedChannel()
+    game_process = mp.Process(target=run, args=(game, channel, args.trace))
     game_process.start()
 
     players = iter(GA.population)
@@ -71,33 +329,32 @@ if __name__ == '__main__':
     # Play the game
     while game_process.is_alive():
         try:
-            game_state, player_data = state_queue.get()
-            # Tomar un individuo de la población y hacer que juegue
-            # Cuando llegue a reset:
-            #    - Actualizar fitness del individuo
-            #    - Cambiar a otro individuo
-            # Cuando no queden mas individuos, reproducir nueva generación.
-            # Repetir hasta n_generations
-
-            # print(game_state, player_data)
-
-            if not ia_player_handler(current_player, actions_queue, game_state, player_data):
-                try:
-                    print("El jugador ha sido cambiado")
-                    current_player = next(players)
-                except StopIteration as e:  # Se han usado todos los players de esta generación
-                    print("Usando generación nueva ")
-                    GA.breed_new_generation()
-                    print("Fitness última generación")
-                    print(GA.fitness)
-                    players = iter(GA.population)
-                    current_player = next(players)
-
-        except EmptyQueue as e:
-            print(e)
-            print("No se ha recibido más estados desde el juego")
-            game_process.terminate()
+            frame_seq, game_state, distances, score = channel.read(timeout=1)
+        except ChannelTimeout:
+            continue
+        player_data = distances if game_state == GameStates.PLAYING else score
+        # Tomar un individuo de la población y hacer que juegue
+        # Cuando llegue a reset:
+        #    - Actualizar fitness del individuo
+        #    - Cambiar a otro individuo
+        # Cuando no queden mas individuos, reproducir nueva generación.
+        # Repetir hasta n_generations
+
+        if not ia_player_handler(current_player, channel, frame_seq, game_state, player_data):
+            try:
+                print("El jugador ha sido cambiado")
+                current_player = next(players)
+            except StopIteration as e:  # Se han usado todos los players de esta generación
+                print("Usando generación nueva ")
+                GA.breed_new_generation()
+                print("Fitness última generación")
+                print(GA.fitness)
+                if checkpoint is not None:
+                    checkpoint(GA)
+                players = iter(GA.population)
+                current_player = next(players)
     game_process.join()
+    channel.close()
 
 """
 TODO: 
@@ -0,0 +1,128 @@
+"""
+Hace jugar a una red guardada (ver ia.network_file) sin crear un GeneticAlg, para mostrar o medir a un campeón.
+
+    python replay.py mejor.bin --episodes 10 --seed 1
+    python replay.py mejor.bin --render --fps 60
+    python replay.py mejor.bin --render --fps 60 --render-every 4
+    python replay.py mejor.bin --episodes 50 --trace historial/
+
+Sin --render el juego corre sin ventana y sin límite de FPS. Al final se informa el puntaje de cada episodio y la
+latencia de la decisión de la red por cuadro.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from game.engine import FlappyEngine, EpisodeLimits, JUMP_THRESHOLD, NO_LIMITS
+from game.trace import TraceWriter
+from ia.network_file import load_compiled, read_header
+
+
+def timed_decision(network, distances, latencies):
+    """ Decide si el ave salta y agrega a latencies los segundos que tomó la red """
+    start = time.perf_counter()
+    jump = network.feed_forward(distances)[0] > JUMP_THRESHOLD
+    latencies.append(time.perf_counter() - start)
+    return jump
+
+
+def replay_headless(network, engine, seed, limits, latencies, recorder=None):
+    engine.reset(seed)
+    deadline = limits.deadline()
+    while not engine.check_limits(limits, deadline):
+        distances = engine.get_distances()
+        jump = timed_decision(network, distances, latencies)
+        if recorder is not None:
+            recorder.record_frame(engine, jump)
+        if not engine.step(jump):
+            break
+    return engine.result()
+
+
+def replay_rendered(network, game, seed, latencies, fps=0):
+    """ Juega un episodio dibujándolo. Con fps 0 se dibuja tan rápido como se pueda; fps limita los cuadros dibujados """
+    distances = game.reset(seed)
+    done = False
+    while not done and game.is_executing:
+        game.handle_events()
+        if fps and game.frame_due():
+            game.clock.tick(fps)
+        distances, _, done = game.step(timed_decision(network, distances, latencies))
+    return game.engine.result()
+
+
+def replay(path, episodes=1, seed=None, limits=NO_LIMITS, render=False, fps=0, recorder=None, render_every=1):
+    """
+    :param seed: Semilla del primer episodio; el episodio i usa seed + i. Si es None los tubos son aleatorios
+    :param recorder: TraceWriter (game.trace) donde se graban los cuadros jugados
+    :param render_every: Con render se dibuja uno de cada render_every cuadros simulados
+    :return: (lista de EpisodeResult, arreglo con la latencia de cada decisión en segundos)
+    """
+    network = load_compiled(path)
+    results = []
+    latencies = []
+
+    if render:
+        # pygame solo se necesita para dibujar
+        from game.flappy import FlappyGame
+        game = FlappyGame(limits=limits, recorder=recorder, render_every=render_every)
+        game.init_engine()
+    else:
+        engine = FlappyEngine()
+
+    for episode in range(episodes):
+        episode_seed = None if seed is None else seed + episode
+        if render:
+            result = replay_rendered(network, game, episode_seed, latencies, fps)
+            # Se cerró la ventana a mitad del episodio
+            if not game.is_executing:
+                break
+            results.append(result)
+        else:
+            results.append(replay_headless(network, engine, episode_seed, limits, latencies, recorder))
+
+    if render:
+        game.quit()
+    if recorder is not None:
+        recorder.close()
+    return results, np.array(latencies)
+
+
+def print_report(results, latencies, elapsed):
+    for i, result in enumerate(results):
+        print("Episodio {}: puntaje {}, fitness {:.3f}, {} cuadros, {}".format(
+            i + 1, result.score, result.fitness, result.ticks, "cortado por límite" if result.truncated else "choque"))
+    if not len(latencies):
+        return
+    scores = np.array([result.score for result in results])
+    microseconds = latencies * 1e6
+    print("Puntaje promedio {:.2f}, mínimo {}, máximo {}".format(scores.mean(), scores.min(), scores.max()))
+    print("Latencia por cuadro (us): promedio {:.1f}, p50 {:.1f}, p99 {:.1f}, máximo {:.1f}".format(
+        microseconds.mean(), np.percentile(microseconds, 50), np.percentile(microseconds, 99), microseconds.max()))
+    print("{} cuadros en {:.2f} s ({:.0f} cuadros por segundo)".format(len(latencies), elapsed,
+                                                                      len(latencies) / elapsed))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Juega con una red guardada')
+    parser.add_argument('network', help='Archivo de la red (ver ia.network_file)')
+    parser.add_argument('--episodes', type=int, default=1, help='Cantidad de episodios')
+    parser.add_argument('--seed', type=int, default=None, help='Semilla de los tubos del primer episodio')
+    parser.add_argument('--render', action='store_true', help='Dibuja el juego en una ventana')
+    parser.add_argument('--fps', type=int, default=0, help='Límite de FPS al dibujar. 0 corre sin límite')
+    parser.add_argument('--render-every', type=int, default=1, help='Dibuja uno de cada N cuadros simulados')
+    parser.add_argument('--max-ticks', type=int, default=None, help='Cuadros máximos por episodio')
+    parser.add_argument('--max-score', type=int, default=None, help='Puntaje con el que se corta un episodio')
+    parser.add_argument('--episode-seconds', type=float, default=None, help='Segundos máximos por episodio')
+    parser.add_argument('--trace', default=None, help='Directorio del historial cuadro a cuadro (ver game.trace)')
+    args = parser.parse_args()
+
+    header, _ = read_header(args.network)
+    print("Red {} de {} neuronas {}".format(header['layers_conf'], header['neuron_type'], header['metadata']))
+    frames_recorder = TraceWriter(args.trace) if args.trace is not None else None
+    start = time.perf_counter()
+    episode_results, decision_latencies = replay(args.network, args.episodes, args.seed,
+                                                 EpisodeLimits(args.max_ticks, args.max_score, args.episode_seconds),
+                                                 args.render, args.fps, frames_recorder, args.render_every)
+    print_report(episode_results, decision_latencies, time.perf_counter() - start)
@@ -0,0 +1,63 @@
+"""
+A run resumed from a checkpoint must continue exactly as the uninterrupted run, and the spectator must not change the
+fitness of the organisms it draws.
+"""
+import functools
+
+import numpy as np
+import pytest
+
+from game.batch import play_networks
+from game.engine import EpisodeLimits
+from ia.checkpoint import Checkpointer, load_checkpoint, restore_checkpoint
+from ia.EvolutionaryNetwork import NetworkOrganism, GeneticAlg, network_fitness, selection_function
+from ia.evaluation import SequentialEvaluator, population_genes
+from ia.genetic_algorithm import EarlyStopping
+
+LIMITS = EpisodeLimits(max_ticks=400)
+
+
+def genetic_alg(play_function=play_networks):
+    evaluator = SequentialEvaluator(functools.partial(play_function, limits=LIMITS), batched=True)
+    return GeneticAlg(pop_size=12, organism_type=NetworkOrganism, fitness_function=network_fitness,
+                      selection_function=selection_function, mutation_rate=.1, evaluator=evaluator, seed=5,
+                      episodes=3, early_stopping=EarlyStopping())
+
+
+def test_resume_continues_exactly(tmp_path):
+    path = str(tmp_path / 'run.npz')
+    uninterrupted = genetic_alg()
+    uninterrupted.evolve(generations=4)
+
+    first_half = genetic_alg()
+    first_half.evolve(generations=2, checkpoint=Checkpointer(path))
+    snapshot = load_checkpoint(path)
+    # Genes and fitness describe the same organisms: the elite keeps its fitness, offspring are not evaluated yet
+    _, genes = population_genes(first_half.population)
+    assert np.array_equal(snapshot['genes'], genes)
+    assert len(snapshot['fitness']) == len(genes)
+    assert np.isnan(snapshot['fitness'][len(genes) // 2:]).all()
+
+    resumed = restore_checkpoint(genetic_alg(), path)
+    assert resumed.generation == 2
+    resumed.evolve(generations=2)
+
+    assert resumed.generation == uninterrupted.generation
+    assert np.array_equal(resumed.fitness, uninterrupted.fitness)
+    assert np.array_equal(population_genes(resumed.population)[1], population_genes(uninterrupted.population)[1])
+
+
+def test_spectator_matches_headless():
+    pytest.importorskip('pygame')
+    from game.spectator import SpectatorGame
+
+    spectator = SpectatorGame(render_every=8, fps=0)
+    # Each GA seeds the global generators, so it is built right before evolving
+    headless = genetic_alg()
+    headless.evolve(generations=2)
+    spectated = genetic_alg(spectator.play_networks)
+    spectated.evolve(generations=2)
+    spectator.close()
+
+    assert spectator.episodes > 0
+    assert np.array_equal(headless.fitness, spectated.fitness)
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+Los choques del motor deben coincidir cuadro a cuadro con los de las máscaras de pygame (FlappyGame con
+validate_collisions), y los de BatchFlappyEngine con los de FlappyEngine.
+"""
+import random
+
+import numpy as np
+import pytest
+
+from game.batch import BatchFlappyEngine
+from game.engine import FlappyEngine
+from game.hitbox import pixel, pixels
+
+
+def random_jumps(seed, probability=.12):
+    rng = random.Random(seed)
+    return lambda: rng.random() < probability
+
+
+def test_pixel_rounds_half_away_from_zero():
+    values = [10.5, -10.5, -.5, .5, 2.4999, 32.5, -200.5, 7]
+    assert [pixel(value) for value in values] == [11, -11, -1, 1, 2, 33, -201, 7]
+    assert pixels(values).tolist() == [11, -11, -1, 1, 2, 33, -201, 7]
+
+
+def test_engine_matches_pygame_masks():
+    pytest.importorskip('pygame')
+    from game.flappy import FlappyGame
+
+    game = FlappyGame(validate_collisions=True)
+    game.init_engine()
+    jump = random_jumps(0)
+    for seed in range(300):
+        game.reset(seed)
+        done = False
+        while not done:
+            _, _, done = game.step(jump(), render=False)
+    assert game.collision_mismatches == 0
+
+
+def test_batch_matches_engine():
+    n_birds = 50
+    batch = BatchFlappyEngine(n_birds, seed=1)
+    engines = [FlappyEngine(seed=1) for _ in range(n_birds)]
+    jump = random_jumps(1)
+    while batch.alive.any():
+        jumps = np.array([jump() for _ in range(n_birds)])
+        alive = batch.step(jumps)
+        for i, engine in enumerate(engines):
+            if not engine.done:
+                engine.step(jumps[i])
+        assert alive.tolist() == [not engine.done for engine in engines]
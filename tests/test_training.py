@@ -0,0 +1,64 @@
+"""
+train_batch must follow the same gradient as train: a batch of one sample gives the same network, and the update of
+a bigger batch matches the finite-difference gradient of the mean error.
+"""
+import numpy as np
+
+from ia.NeuralNetwork import NeuralNetwork
+from ia.Neuron import Sigmoid
+
+LAYERS_CONF = [3, 4, 2]
+
+
+def random_parameters(rng):
+    weights = [rng.normal(scale=.5, size=shape) for shape in zip(LAYERS_CONF[:-1], LAYERS_CONF[1:])]
+    biases = [rng.normal(scale=.5, size=nneurons) for nneurons in LAYERS_CONF[1:]]
+    return weights, biases
+
+
+def network(parameters, learning_rate=.5):
+    weights, biases = parameters
+    return NeuralNetwork.from_parameters(weights, biases, learning_rate=learning_rate, neuron_type=Sigmoid)
+
+
+def test_batch_of_one_matches_train():
+    rng = np.random.default_rng(0)
+    parameters = random_parameters(rng)
+    sample, expected = rng.normal(size=3), np.array([1., 0.])
+    per_sample, batched = network(parameters), network(parameters)
+
+    error = per_sample.train(sample, expected)
+    batch_error = batched.train_batch([sample], [expected])
+
+    assert np.isclose(error, batch_error)
+    for layer, batched_layer in zip(per_sample.compile().weights + per_sample.compile().biases,
+                                    batched.compile().weights + batched.compile().biases):
+        assert np.allclose(layer, batched_layer)
+
+
+def mean_error(parameters, inputs, expected):
+    """ Half the squared error summed over outputs, averaged over the batch: the loss train_batch descends """
+    outputs = network(parameters).feed_forward(inputs)
+    return np.mean(np.sum((outputs - expected) ** 2, axis=1)) / 2
+
+
+def test_batch_step_follows_finite_differences():
+    rng = np.random.default_rng(1)
+    parameters = random_parameters(rng)
+    inputs, expected = rng.normal(size=(8, 3)), rng.integers(0, 2, size=(8, 2)).astype(float)
+    learning_rate = .5
+    trained = network(parameters, learning_rate)
+    trained.train_batch(inputs, expected)
+    new_weights = trained.compile().weights
+
+    step = 1e-6
+    for layer in range(len(parameters[0])):
+        for index in np.ndindex(parameters[0][layer].shape):
+            weights = [w.copy() for w in parameters[0]]
+            weights[layer][index] += step
+            upper = mean_error((weights, parameters[1]), inputs, expected)
+            weights[layer][index] -= 2 * step
+            lower = mean_error((weights, parameters[1]), inputs, expected)
+            gradient = (upper - lower) / (2 * step)
+            update = new_weights[layer][index] - parameters[0][layer][index]
+            assert np.isclose(update, -learning_rate * gradient, rtol=1e-4, atol=1e-8)